@@ -0,0 +1,478 @@
+'''
+Offline benchmark for wordsearcher.
+
+Starts a local HTTP server that stands in for the New York Times, Datamuse,
+Merriam-Webster and Ngram APIs (and the article pages themselves), points
+wordsearcher at it and times each stage of results_object_generator on synthetic
+corpora of several sizes. Results are saved as JSON so they can be compared
+between commits.
+
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json --latency 50
+'''
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlparse
+
+import wordsearcher
+
+#Number of articles per topic and words per article for each corpus size
+CORPUS_SIZES = {
+    "small": (5, 300),
+    "medium": (10, 1000),
+    "large": (40, 2000),
+}
+
+#The streaming pipeline times collection, parsing, classification and aggregation
+#together as "pipeline", and each of them again as an overlapped stage. The staged
+#one times them separately, apart from collection and parsing in shards, which also
+#overlap and are timed as "pipeline"
+STAGES = ("url_fetch", "pipeline", "text_collection", "parsing", "classification",
+          "aggregation", "charts", "report")
+
+SYLLABLES = ("ka", "lo", "mi", "ne", "ru", "sa", "to", "vi", "bre", "dan",
+             "fel", "gor", "hin", "jus", "pla", "ster", "qua", "zy")
+PARTS_OF_SPEECH = ("noun", "verb", "adjective", "adverb", "pronoun", "preposition",
+                   "definite article", "noun phrase")
+LANGUAGES = ("Greek", "Latin", "French", "English", "German", "Norse")
+
+class Mock_APIs:
+    """
+    Deterministic fake data for every API the pipeline calls. The same word or
+    article always gets the same answer, so runs are comparable.
+    """
+    def __init__(self,articles_per_topic,words_per_article,vocabulary_size=3000,inflection_rate=0.0):
+        self.articles_per_topic = articles_per_topic
+        self.words_per_article = words_per_article
+        self.inflection_rate = inflection_rate #Share of words written as an inflected form
+        self.lemmas = {} #inflected form -> (lemma, suffix), filled as articles are written
+        rng = random.Random(0)
+        self.vocabulary = list(dict.fromkeys(
+            "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4)))
+            for _ in range(vocabulary_size)))
+        self.vocabulary.extend(wordsearcher.words_to_ignore)
+
+    def word_syllables(self,word):
+        return max(1, sum(word.count(vowel) for vowel in "aeiouy"))
+
+    def search(self,topic,page,base_url):
+        first = page*wordsearcher.NYT_PAGE_SIZE
+        last = min(first + wordsearcher.NYT_PAGE_SIZE, self.articles_per_topic)
+        docs = [{"web_url": f"{base_url}/article/{topic}/{i}"} for i in range(first, last)]
+        return {"response": {"docs": docs, "meta": {"hits": self.articles_per_topic}}}
+
+    def article(self,topic,number):
+        rng = random.Random(f"{topic}/{number}")
+        paragraphs = []
+        remaining = self.words_per_article
+        while remaining > 0:
+            sentence_words = []
+            for _ in range(min(remaining, rng.randint(20, 60))):
+                word = rng.choice(self.vocabulary)
+                if rng.random() < self.inflection_rate:
+                    word = self.inflector(word, rng)
+                if rng.random() < 0.1:
+                    word = word.title()
+                sentence_words.append(word)
+                if rng.random() < 0.08:
+                    sentence_words[-1] += rng.choice([".", ",", "?", ";"])
+            remaining -= len(sentence_words)
+            paragraphs.append(" ".join(sentence_words).capitalize() + ". ")
+        body = "".join(f'<p class="css-axufdj evys1bk0">{paragraph}</p>\n' for paragraph in paragraphs)
+        return f"<html><head><title>{topic}</title></head><body><article>{body}</article></body></html>"
+
+    def inflector(self,word,rng):
+        """
+        An inflected form of a vocabulary word that fits its part of speech (plurals for
+        nouns, -s, -ed and -ing for verbs), or the word itself for anything else.
+        """
+        part_of_speech = self.word_data(word)[0]
+        if "verb" in part_of_speech and "adverb" not in part_of_speech:
+            suffix = rng.choice(("s", "ed", "ing"))
+        elif "noun" in part_of_speech:
+            suffix = "s"
+        else:
+            return word
+        if word.endswith("e") and suffix != "s":
+            form = word[:-1] + suffix
+        else:
+            form = word + suffix
+        self.lemmas[form] = (word, suffix)
+        return form
+
+    def word_data(self,word):
+        rng = random.Random(word)
+        origins = " and ".join(rng.sample(LANGUAGES, rng.randint(0, 3)))
+        return rng.choice(PARTS_OF_SPEECH), origins
+
+    def datamuse(self,word):
+        #About one word in five is "unknown" to Datamuse, like proper nouns are
+        lemma, suffix = self.lemmas.get(word, (word, ""))
+        if hash_fraction(lemma) < 0.2:
+            return [{"word": word + "s", "numSyllables": self.word_syllables(word) + 1}]
+        syllables = self.word_syllables(lemma)
+        if suffix == "ing" or suffix == "ed" and lemma.rstrip("e")[-1] in "td":
+            syllables += 1
+        elif suffix == "s" and lemma.endswith(("ce", "ge", "se", "xe", "ze")):
+            syllables += 1
+        return [{"word": word, "numSyllables": syllables}]
+
+    def merriam_webster(self,word):
+        lemma, suffix = self.lemmas.get(word, (word, ""))
+        part_of_speech, origins = self.word_data(lemma)
+        if suffix in ("ed", "ing"):
+            part_of_speech = "verb"
+        return [{"fl": part_of_speech, "et": [["text", f"from {origins}"]]}]
+
+    def ngram(self,words,year_start,year_end):
+        results = []
+        for word in words:
+            rng = random.Random(word)
+            slope = rng.uniform(-1, 1)
+            series = [max(0.0, 1e-6*(1 + slope*(year - year_start)/100 + rng.random()*0.1))
+                      for year in range(year_start, year_end + 1)]
+            results.append({"ngram": word, "timeseries": series})
+        return results
+
+def hash_fraction(text):
+    return random.Random(text).random()
+
+def mock_handler_maker(mock,latency,counts):
+    """
+    Builds the request handler class for the mock server.
+    """
+    class Mock_Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            time.sleep(latency)
+            parsed = urlparse(self.path)
+            query = parse_qs(parsed.query)
+            parts = [unquote(part) for part in parsed.path.strip("/").split("/")]
+            base_url = f"http://{self.headers['Host']}"
+            if parsed.path.startswith("/svc/search"):
+                page = int(query.get("page", ["0"])[0])
+                api, body = "nytimes", json.dumps(mock.search(query["q"][0], page, base_url))
+            elif parts[0] == "article":
+                api, body = "article", mock.article(parts[1], int(parts[2]))
+            elif parts[0] == "words":
+                api, body = "datamuse", json.dumps(mock.datamuse(query["sl"][0]))
+            elif parts[0] == "mw":
+                api, body = "merriam_webster", json.dumps(mock.merriam_webster(parts[1]))
+            elif parts[0] == "ngrams":
+                api, body = "ngram", json.dumps(mock.ngram(
+                    query["content"][0].split(","), int(query["year_start"][0]), int(query["year_end"][0])))
+            else:
+                self.send_error(404)
+                return
+            with counts_lock:
+                counts[api] = counts.get(api, 0) + 1
+            data = body.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self,*args):
+            pass
+
+    counts_lock = threading.Lock()
+    return Mock_Handler
+
+@contextlib.contextmanager
+def mock_server(mock,latency):
+    """
+    Runs the mock APIs on a local port and points wordsearcher at them. Yields the
+    dict of request counts per API.
+    """
+    counts = {}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), mock_handler_maker(mock, latency, counts))
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    saved = {name: getattr(wordsearcher, name) for name in
+             ("NYT_SEARCH_URL", "DATAMUSE_URL", "MW_URL", "NGRAM_URL", "NYT_RATE_LIMITER")}
+    #The mock has no rate limit, so searches shouldn't wait for one
+    wordsearcher.NYT_RATE_LIMITER = wordsearcher.Token_Bucket(1000, 1000)
+    wordsearcher.NYT_SEARCH_URL = base_url + "/svc/search/v2/articlesearch.json"
+    wordsearcher.DATAMUSE_URL = base_url + "/words"
+    wordsearcher.MW_URL = base_url + "/mw/"
+    wordsearcher.NGRAM_URL = base_url + "/ngrams/json"
+    os.environ.setdefault("WORDSEARCHER_NYTIMES", "benchmark")
+    os.environ.setdefault("WORDSEARCHER_WORDKEY", "benchmark")
+    try:
+        yield counts
+    finally:
+        for name, value in saved.items():
+            setattr(wordsearcher, name, value)
+        server.shutdown()
+        server.server_close()
+
+@contextlib.contextmanager
+def fresh_caches(work_dir):
+    """
+    Opens empty word, article and trend caches in work_dir and runs from there, so
+    charts and databases don't end up in the repository.
+    """
+    old_dir = os.getcwd()
+    os.chdir(work_dir)
+    wordsearcher.WORD_CACHE_PATH = os.path.join(work_dir, "word_cache.db")
+    wordsearcher.ARTICLE_CACHE_PATH = os.path.join(work_dir, "article_cache.db")
+    wordsearcher.TREND_CACHE_PATH = os.path.join(work_dir, "trend_cache.db")
+    wordsearcher.ARTICLE_CACHE = None
+    wordsearcher.TREND_CACHE = None
+    wordsearcher.word_cache = wordsearcher.Word_Store(wordsearcher.WORD_CACHE_PATH)
+    try:
+        yield
+    finally:
+        os.chdir(old_dir)
+
+def pipeline_timer(topic,search_count,articles):
+    """
+    Runs a search and returns its metrics record. URLs are fetched on their own (not
+    overlapped with the downloads) so each stage is timed separately.
+    """
+    with wordsearcher.search_metrics(topic) as metrics:
+        with wordsearcher.stage_timer("url_fetch"):
+            urls = wordsearcher.article_url_fetcher(topic, articles)
+        results_object = wordsearcher.results_object_generator(urls, topic, search_count)
+        results_object.html_report()
+    return metrics.record()
+
+def size_benchmark(size,latency,topic="benchmark"):
+    """
+    Times a cold run (empty caches) and a warm run (same topic again) for one corpus size.
+    """
+    articles, words = CORPUS_SIZES[size]
+    mock = Mock_APIs(articles, words)
+    work_dir = tempfile.mkdtemp(prefix=f"wordsearcher-bench-{size}-")
+    results = {"articles": articles, "words_per_article": words,
+               "extraction": extractor_benchmark(mock)}
+    if not results["extraction"]["matches"]:
+        print(f"{size}: streaming extractor output differs from BeautifulSoup")
+    try:
+        with mock_server(mock, latency) as counts, fresh_caches(work_dir):
+            for run in ("cold", "warm"):
+                counts.clear()
+                with contextlib.redirect_stdout(io.StringIO()):
+                    record = pipeline_timer(topic, 1, articles)
+                seconds = dict(record["stages"], total=record["total_seconds"])
+                results[run] = {"seconds": seconds, "overlapped_seconds": record["overlapped_stages"],
+                                "requests": dict(counts), "caches": record["caches"]}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+#Markup the NYT extractor has to handle the same way BeautifulSoup does
+TRICKY_PARAGRAPHS = (
+    '<p class="css-axufdj evys1bk0">Entities &amp; “quotes” &#8212; kept.</p>',
+    '<p class="css-axufdj evys1bk0">Mixed <a href="#">link</a> is skipped.</p>',
+    '<p class="css-axufdj evys1bk0"><em>A single tag is followed.</em></p>',
+    '<p class="css-axufdj evys1bk0"><b>Unclosed tags are closed.</p>',
+    '<p class="css-axufdj  evys1bk0">Extra whitespace in the class.</p>',
+    '<p class="evys1bk0">Other classes are ignored.</p>',
+    '<div><p class="css-axufdj evys1bk0">Closed by its parent.</div>',
+    '<p class="css-axufdj evys1bk0">Breaks<br>are skipped.</p>',
+)
+
+def extractor_benchmark(mock,topic="benchmark",chunk_size=4096):
+    """
+    Checks that the streaming extractor gives the same text as the BeautifulSoup one
+    on every synthetic article (with some tricky markup added) and times both.
+    """
+    pages = [mock.article(topic, i).replace("<article>", "<article>" + "".join(TRICKY_PARAGRAPHS))
+             for i in range(mock.articles_per_topic)]
+    start = time.perf_counter()
+    soup_texts = [wordsearcher.soup_text_extractor(page) for page in pages]
+    soup_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    stream_texts = []
+    for page in pages:
+        extractor = wordsearcher.Paragraph_Extractor()
+        for i in range(0, len(page), chunk_size):
+            extractor.feed(page[i:i+chunk_size])
+        extractor.close()
+        stream_texts.append(extractor.story_text())
+    stream_seconds = time.perf_counter() - start
+    return {"soup_seconds": soup_seconds, "stream_seconds": stream_seconds,
+            "matches": soup_texts == stream_texts}
+
+#Imports the module did at startup before they were made lazy
+EAGER_IMPORTS = "import requests, bs4, numpy, plotly.graph_objects; "
+TEXT_ANALYSIS = ("wordsearcher.text_parser('The cat sat on the mat. It was happy!', 'cats'); "
+                 "wordsearcher.syllable_estimator('happy')")
+
+def startup_timer(code,repeat):
+    """
+    Runs code in a fresh interpreter repeat times and returns the median wall time.
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True,
+                       cwd=os.path.dirname(os.path.abspath(wordsearcher.__file__)))
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+def startup_benchmark(repeat=7):
+    """
+    Compares the time for a new process to import wordsearcher and run the text
+    analysis functions against doing the same with all of the heavy dependencies
+    imported up front, the way the module used to start.
+    """
+    baseline = startup_timer("pass", repeat)
+    lazy = startup_timer("import wordsearcher; " + TEXT_ANALYSIS, repeat)
+    eager = startup_timer(EAGER_IMPORTS + "import wordsearcher; " + TEXT_ANALYSIS, repeat)
+    return {
+        "interpreter_seconds": baseline,
+        "text_analysis_seconds": lazy,
+        "eager_imports_seconds": eager,
+        "import_fraction": (lazy - baseline)/(eager - baseline),
+    }
+
+def lemma_benchmark(latency,articles=10,words=1000,inflection_rate=0.3,topic="benchmark"):
+    """
+    Counts the dictionary API calls for a cold run on a corpus with inflected forms,
+    with and without classifying the forms from their lemmas.
+    """
+    mock = Mock_APIs(articles, words, inflection_rate=inflection_rate)
+    results = {"articles": articles, "words_per_article": words, "inflection_rate": inflection_rate}
+    for reuse in (False, True):
+        wordsearcher.LEMMA_REUSE = reuse
+        work_dir = tempfile.mkdtemp(prefix="wordsearcher-bench-lemmas-")
+        try:
+            with mock_server(mock, latency) as counts, fresh_caches(work_dir):
+                with contextlib.redirect_stdout(io.StringIO()):
+                    record = pipeline_timer(topic, 1, articles)
+                wordsearcher.word_cache.close()
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+        run = "with_lemmas" if reuse else "without_lemmas"
+        results[run] = {"api_calls": counts.get("datamuse", 0) + counts.get("merriam_webster", 0),
+                        "seconds": record["total_seconds"],
+                        "derived": record["caches"].get("lemma", {}).get("hits", 0)}
+    wordsearcher.LEMMA_REUSE = True
+    without, with_lemmas = results["without_lemmas"]["api_calls"], results["with_lemmas"]["api_calls"]
+    results["saved_fraction"] = (without - with_lemmas)/without if without else 0.0
+    return results
+
+def lexicon_consistency(path=wordsearcher.WORD_CACHE_JSON):
+    """
+    Checks the lemma rules against a real word cache: every word in it that can be
+    derived from another word in it is derived, and the result is compared with the
+    record the APIs gave. The mock APIs inflect words the same way the rules do, so
+    only real records can show where the rules are wrong.
+    """
+    with open(path) as cache_file:
+        records = json.load(cache_file)
+    work_dir = tempfile.mkdtemp(prefix="wordsearcher-bench-lexicon-")
+    try:
+        with fresh_caches(work_dir):
+            wordsearcher.word_cache.update(records)
+            derived, deferred = wordsearcher.lemma_classifier(list(records))
+            wordsearcher.word_cache.close()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    results = {"words": len(records), "derivable_forms": len(derived), "syllables": 0,
+               "part_of_speech": 0, "origins": 0, "matching_forms": 0, "syllable_mismatches": []}
+    for word, record in derived.items():
+        api_record = records[word]
+        results["syllables"] += record[1] == api_record[1]
+        results["part_of_speech"] += record[2] == api_record[2]
+        results["origins"] += sorted(record[3]) == sorted(api_record[3])
+        results["matching_forms"] += record[:4] == api_record[:4]
+        if record[1] != api_record[1]:
+            results["syllable_mismatches"].append([word, record[1], api_record[1]])
+    return results
+
+def baseline_comparer(results,baseline):
+    """
+    Prints the change in each stage's time against a saved baseline.
+    """
+    print(f"{'size':8} {'run':5} {'stage':16} {'baseline':>10} {'now':>10} {'change':>8}")
+    for size, size_results in results["sizes"].items():
+        if size not in baseline.get("sizes", {}):
+            continue
+        for run in ("cold", "warm"):
+            for stage in STAGES + ("total",):
+                old = baseline["sizes"][size][run]["seconds"].get(stage)
+                new = size_results[run]["seconds"].get(stage)
+                if old is None or new is None:
+                    continue
+                change = f"{(new - old)/old*100:+.0f}%" if old > 0 else "n/a"
+                print(f"{size:8} {run:5} {stage:16} {old:10.4f} {new:10.4f} {change:>8}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for wordsearcher")
+    parser.add_argument("--sizes", nargs="+", choices=list(CORPUS_SIZES), default=list(CORPUS_SIZES))
+    parser.add_argument("--latency", type=float, default=20, help="milliseconds added to every mock API response")
+    parser.add_argument("--output", default="bench_results.json", help="where to save the results")
+    parser.add_argument("--compare", help="saved results to compare against")
+    parser.add_argument("--startup", action="store_true", help="also time process startup for text analysis")
+    parser.add_argument("--lemmas", action="store_true", help="also count the API calls saved by lemma reuse")
+    parser.add_argument("--staged", action="store_true", help="time each stage separately instead of the streaming pipeline")
+    args = parser.parse_args(argv)
+    wordsearcher.STREAMING_PIPELINE = not args.staged
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "latency_ms": args.latency,
+        "pipeline": "staged" if args.staged else "streaming",
+        "sizes": {},
+    }
+    for size in args.sizes:
+        results["sizes"][size] = size_benchmark(size, args.latency/1000)
+        cold = results["sizes"][size]["cold"]["seconds"]
+        print(f"{size}: " + ", ".join(f"{stage} {cold[stage]:.3f}s" for stage in STAGES + ("total",) if stage in cold))
+        overlapped = results["sizes"][size]["cold"]["overlapped_seconds"]
+        if overlapped:
+            print(f"{size} pipeline busy time: " + ", ".join(f"{stage} {overlapped[stage]:.3f}s"
+                                                           for stage in STAGES if stage in overlapped))
+
+    if args.startup:
+        results["startup"] = startup_benchmark()
+        startup = results["startup"]
+        print(f"startup: text analysis {startup['text_analysis_seconds']:.3f}s, "
+              f"with eager imports {startup['eager_imports_seconds']:.3f}s, "
+              f"interpreter alone {startup['interpreter_seconds']:.3f}s "
+              f"(imports take {startup['import_fraction']:.0%} of the eager time)")
+
+    if args.lemmas:
+        results["lemmas"] = lemma_benchmark(args.latency/1000)
+        lemmas = results["lemmas"]
+        print(f"lemmas: {lemmas['without_lemmas']['api_calls']} dictionary API calls without lemma reuse, "
+              f"{lemmas['with_lemmas']['api_calls']} with it ({lemmas['saved_fraction']:.0%} saved, "
+              f"{lemmas['with_lemmas']['derived']} words derived)")
+        if os.path.exists(wordsearcher.WORD_CACHE_JSON):
+            lexicon = lexicon_consistency(os.path.abspath(wordsearcher.WORD_CACHE_JSON))
+            lemmas["lexicon"] = lexicon
+            print(f"lexicon: {lexicon['derivable_forms']} of {lexicon['words']} cached words derivable, "
+                  f"syllables match for {lexicon['syllables']}, part of speech for "
+                  f"{lexicon['part_of_speech']}, origins for {lexicon['origins']}, "
+                  f"all three for {lexicon['matching_forms']}")
+
+    with open(args.output, "w") as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline_comparer(results, json.load(baseline_file))
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
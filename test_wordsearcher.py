@@ -0,0 +1,171 @@
+"""
+Checks text_parser() against the character loop it replaced. The loop is kept here
+as the reference: the sentence count, word count and word_dict (with its key order)
+have to come out the same for any text.
+"""
+import random
+from collections import Counter
+
+import pytest
+
+import wordsearcher
+
+def reference_parser(articles):
+    """
+    The original text_parser() counting, one character and one word at a time.
+    """
+    no_punctuation = ""
+    sentence_count = 0
+    for x in articles:
+        if x in "1234567890@#$%^&*()-+_=[],:;/'"+'"'+'“”—':
+            pass
+        elif x in ".?!":
+            sentence_count += 1
+            no_punctuation += " "
+        else:
+            no_punctuation += x
+
+    word_count = 0
+    word_dict = {}
+    for word in no_punctuation.split():
+        word_count += 1
+        word = word.strip()
+        if word.lower() not in word_dict:
+            word_dict[word.lower()] = [0,0,0,0]
+        if word.islower():
+            word_dict[word.lower()][0] += 1
+        elif word.istitle():
+            word_dict[word.lower()][1] += 1
+        else:
+            word_dict[word.lower()][2] += 1
+        word_dict[word.lower()][3] += 1
+    return sentence_count, word_count, word_dict
+
+def assert_matches(articles):
+    """
+    Parses the text with text_parser() and with the reference and compares them.
+    """
+    results = wordsearcher.text_parser(articles, "test", cache={})
+    sentence_count, word_count, word_dict = reference_parser(articles)
+    assert results.sentence_count == sentence_count
+    assert results.word_count == word_count
+    assert results.word_dict == word_dict
+    assert list(results.word_dict) == list(word_dict)
+
+EDGE_CASES = [
+    "",
+    " ",
+    "...",
+    "?!?",
+    "word",
+    "Word.",
+    "The cat sat. The Cat sat! THE CAT SAT?",
+    "first.second?third!fourth",
+    "don't can't won't o'clock",
+    "“Quoted,” she said — twice—then left.",
+    "Re-entry, e-mail and co-op: 50% of 1,000 (2021) [sic] @home #tag $5 ^up &co *star /slash =eq +plus _under",
+    "café Café CAFÉ naïve Naïve",
+    "ǅungla ǆ ǅ straße STRASSE",
+    "iPhone McDonald O'Neil MacBook",
+    "tab\tseparated\nnew\nlines\r\nand non breaking spaces",
+    "Ünïcödé ΣΊΣΥΦΟΣ σίσυφος Σίσυφος",
+    "a.b.c.d.e.f",
+    "123 456 7890",
+    "x" * 1000 + " " + "X" * 1000,
+]
+
+@pytest.mark.parametrize("articles", EDGE_CASES)
+def test_edge_cases_match_reference(articles):
+    assert_matches(articles)
+
+def test_random_texts_match_reference():
+    rng = random.Random(3)
+    alphabet = "abcdefghijklmnopqrstuvwxyz" + "ABCDEFGHIJKLMNOPQRSTUVWXYZ" + "éÉüÜßñÑ" + \
+               "1234567890@#$%^&*()-+_=[],:;/'" + '"' + "“”—" + ".?!" + " \t\n" + "‘’–…«»"
+    vocabulary = ["the", "The", "THE", "cat", "Cat", "cAt", "O'Neil", "e-mail", "don't", "U.S.", "café", "Café"]
+    for _ in range(500):
+        parts = []
+        for _ in range(rng.randint(0, 60)):
+            if rng.random() < 0.5:
+                parts.append(rng.choice(vocabulary))
+            else:
+                parts.append("".join(rng.choice(alphabet) for _ in range(rng.randint(1, 12))))
+            parts.append(rng.choice(("", " ", " ", ". ", "\n", "!", "—")))
+        assert_matches("".join(parts))
+
+def test_folded_articles_match_full_parse():
+    """
+    Folding articles in one at a time with text_folder() has to give the same counts,
+    word_dict key order and tail as parsing them all at once, including when a word
+    runs on from one article into the next.
+    """
+    rng = random.Random(5)
+    pieces = ["ab", "Ab", "cd", "Cd", "ef", "x", "abc", ".", "!", " ", "  ", "\n", "-", "é"]
+    for _ in range(3000):
+        articles = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 8)))
+                    for _ in range(rng.randint(1, 5))]
+        folded = wordsearcher.Topic_Results("test", 0, 0, {})
+        for number, article in enumerate(articles):
+            folded.text_folder([str(number)], {str(number): article})
+        text = "".join(articles)
+        full = wordsearcher.text_parser(text, "test", cache={})
+        assert folded.sentence_count == full.sentence_count
+        assert folded.word_count == full.word_count
+        assert list(folded.word_dict.items()) == list(full.word_dict.items())
+        assert folded.tail == wordsearcher.tail_fragment(text)
+
+def reference_syllables(word):
+    """
+    The original syllable_estimator() loop: every letter becomes V or C and the
+    clusters of V are counted. A y at the end counts as a vowel.
+    """
+    syllable_count = 0
+    translated_word = ""
+    for x in word.lower():
+        if x in ['a','e','i','o','u']:
+            translated_word += "V"
+        else:
+            translated_word += "C"
+    if word[-1] == 'y':
+        translated_word = translated_word[:-1] + "VC"
+    else:
+        translated_word += "C"
+    for i in range(len(translated_word)-1):
+        if translated_word[i] == "V" and translated_word[i] != translated_word[i+1]:
+            syllable_count += 1
+    return syllable_count
+
+def test_syllable_estimates_match_reference():
+    rng = random.Random(7)
+    letters = "aeiouyAEIOUYbcdfghklmnprstwxzBCDZéüß'"
+    words = ["a", "y", "Y", "by", "sky", "SKY", "queue", "rhythm", "aeiou", "strengths", "Nguyen",
+             "Zoë", "café", "yay", "Yy", "ya", "eye", "ÆON"]
+    words += ["".join(rng.choice(letters) for _ in range(rng.randint(1, 14))) for _ in range(3000)]
+    estimates = wordsearcher.syllable_estimates(words)
+    for word in words:
+        assert estimates[word] == reference_syllables(word), word
+
+@pytest.mark.parametrize("shard_size", [1, 2, 3, 7, 64])
+def test_sharded_parse_matches_text_parser(shard_size):
+    rng = random.Random(shard_size)
+    pieces = ["ab", "Ab", "cd", "CD", "ef", "x", "abc", "é", ".", "?", " ", "  ", "\n", "—", "'", "1"]
+    for _ in range(300):
+        articles = ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 12)))
+                    for _ in range(rng.randint(1, 5))]
+        shards = list(wordsearcher.text_sharder(articles, shard_size))
+        assert [text for shard in shards for text in shard] == articles
+        parsed = [result for shard in shards for result in wordsearcher.articles_parser(shard)]
+        article_counts = [wordsearcher.article_counter(result) for result in parsed]
+        sentence_count, word_count, word_dict, tail = wordsearcher.shard_merger(parsed)
+        text = "".join(articles)
+        full = wordsearcher.text_parser(text, "test", cache={})
+        assert sentence_count == full.sentence_count
+        assert word_count == full.word_count
+        assert list(word_dict.items()) == list(full.word_dict.items())
+        assert tail == wordsearcher.tail_fragment(text)
+        #Each article on its own, for article_stats
+        for article, (sentences, words, uses) in zip(articles, article_counts):
+            article_sentences, article_words = wordsearcher.text_tokenizer(article)
+            assert sentences == article_sentences
+            assert words == len(article_words)
+            assert uses == Counter(word.lower() for word in article_words)
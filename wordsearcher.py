@@ -3,20 +3,759 @@
 ##### Uniqname: gnickel  ########
 #################################
 
-import requests
+import heapq
+import argparse
+import codecs
+import contextlib
+import contextvars
 import json
-from bs4 import BeautifulSoup
-import numpy as np
-import plotly.graph_objects as go
+import math
+import mmap
+import os
+import re
+import shutil
+import sqlite3
+import struct
+import sys
+import threading
+import time
+import webbrowser
+import zlib
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
+from html import escape
+from html.parser import HTMLParser
+from urllib.parse import parse_qs, urlparse
+
+#requests, bs4, numpy, plotly and secrets are imported by the functions that use
+#them, so the text analysis functions can be used without paying for them at startup
+
+CACHE_DICT = {} #Temporary storage. Stores topic results
+
+PLOTLY_BUNDLE = "plotly.min.js" #One copy per output folder, shared by every chart in it
+
+#API endpoints, kept here so they can be pointed at a local server for benchmarks
+NYT_SEARCH_URL = "https://api.nytimes.com/svc/search/v2/articlesearch.json"
+DATAMUSE_URL = "https://api.datamuse.com/words"
+MW_URL = "https://www.dictionaryapi.com/api/v3/references/collegiate/json/"
+NGRAM_URL = "https://books.google.com/ngrams/json"
+
+WORD_CACHE_PATH = 'word_cache.db' #Word classifications
+WORD_CACHE_JSON = 'word_cache.json' #Old format, imported into WORD_CACHE_PATH once
+LEXICON_SNAPSHOT_PATH = 'lexicon.bin' #Read-only copy of the word cache for fast lookups, built with --build-lexicon
+
+ARTICLE_CACHE_PATH = 'article_cache.db' #Compressed article bodies, keyed by URL
+ARTICLE_CACHE_MAX_BYTES = 64*1024*1024 #Compressed size kept before the least recently used are evicted
+ARTICLE_CACHE_TTL = None #Seconds an article is kept, None keeps it until it is evicted
+ARTICLE_CACHE = None #Opened the first time an article is collected
+ARTICLE_CACHE_LOCK = threading.Lock()
+
+ARTICLE_PARAGRAPH_SELECTOR = ("p", "css-axufdj evys1bk0") #Tag and class of NYT body paragraphs
+ARTICLE_EXTRACTOR = "stream" #"stream" parses pages as they download, "soup" builds a BeautifulSoup tree
+ARTICLE_CHUNK_SIZE = 16*1024 #Bytes read from the page at a time when streaming
+
+TOPIC_STORE_PATH = 'topic_store.db' #Counts of refreshed topics and the articles already in them
+
+TREND_CACHE_PATH = 'trend_cache.db' #Ngram usage time series, keyed by word, corpus and years
+TREND_CACHE = None #Opened the first time a usage trend is needed
+TREND_CACHE_LOCK = threading.Lock()
+NGRAM_BATCH_SIZE = 12 #Words sent to the Ngram viewer in one request
+
+FETCH_WORKERS = 8 #Maximum number of articles downloaded at the same time
+
+SEARCH_ARTICLE_COUNT = 10 #Articles collected per search
+SEARCH_BEGIN_DATE = None #Optional YYYYMMDD limits on article search dates
+SEARCH_END_DATE = None
+NYT_PAGE_SIZE = 10 #Articles on each page of search results
+NYT_MAX_PAGES = 100 #The article search doesn't go past page 100
+NYT_REQUESTS_PER_MINUTE = 5 #Article search rate limit
+NYT_RETRIES = 4 #Times a page is asked for again after a 429 or server error
+NYT_BACKOFF_SECONDS = 12 #Wait before the first retry, doubled for each one after
+HTTP_SESSIONS = {} #One keep-alive session per host, shared by every thread
+HTTP_SESSIONS_LOCK = threading.Lock()
+
+CLASSIFY_WORKERS = 8 #Maximum number of words looked up at the same time, for every topic
+CLASSIFY_POOL = None #Shared worker pool, created the first time words are classified
+CLASSIFY_BATCH_SIZE = 50 #Classifications are committed to the word cache in groups this size
+IN_FLIGHT_WORDS = {} #Words being looked up right now and the future for their result
+IN_FLIGHT_LOCK = threading.Lock()
+SYLLABLE_ESTIMATES = {} #Memo of syllable_estimates(), kept for every topic the process analyzes
+SYLLABLE_ESTIMATES_LIMIT = 100000 #Words the memo holds before it is emptied and started again
+VOWEL_CLUSTERS = re.compile("[aeiou]+")
+LEMMA_REUSE = True #Classifies inflected forms from their lemma in the word cache instead of the APIs
+
+STREAMING_PIPELINE = True #Parses and classifies each article as it arrives, False finishes each stage before the next
+PARSE_WORKERS = 1 #Processes a topic's text is parsed on, 1 parses it all in the calling process
+PARSE_POOL = None #Shared process pool, created the first time a topic is parsed in shards
+PARSE_POOL_SIZE = 0 #Worker processes in PARSE_POOL
+PARSE_POOL_LOCK = threading.Lock()
+PARSE_SHARD_SIZE = 1024*1024 #Characters of text handed to a parse worker at a time
+
+APPROXIMATE_COUNTS = False #Counts words in fixed memory and only keeps the most used ones, for archive-scale runs
+SKETCH_EPSILON = 0.0001 #Approximate counts are high by at most this share of all the words...
+SKETCH_DELTA = 0.01 #...except with this probability
+HEAVY_HITTERS = 2000 #Words kept, classified and charted in approximate mode
+
+BATCH_WORKERS = 4 #Worker processes used to analyze topics in batch mode
+
+SERVER_PORT = 8000 #Port the report server listens on
+SERVER_WORKERS = 2 #Topics the report server analyzes at the same time
+SERVER_QUEUE_SIZE = 8 #Topics waiting for the report server, more are turned away until there is room
+
+METRICS_LOG_PATH = None #JSON lines file every search's metrics are added to, None to skip
+ACTIVE_METRICS = contextvars.ContextVar("ACTIVE_METRICS", default=None) #Search_Metrics of the running search
+
+def api_key(name):
+    """
+    Returns an API key from secrets.py. If secrets.py doesn't have it, the key is read
+    from the WORDSEARCHER_<NAME> environment variable instead.
+
+    Parameter
+    ---------
+    name (string) 'nytimes' or 'wordkey'
+
+    Return
+    ---------
+    key (string)
+    """
+    import secrets
+    try:
+        return getattr(secrets, name)
+    except AttributeError:
+        return os.environ[f"WORDSEARCHER_{name.upper()}"]
+
+def http_session(url):
+    """
+    Returns the shared requests Session for the host of a URL, creating it the
+    first time the host is seen. Reusing the session keeps the connection alive
+    between requests instead of opening a new one for every article.
+
+    Parameter
+    ---------
+    url (string)
+
+    Return
+    ---------
+    session (requests.Session)
+    """
+    import requests
+    host = urlparse(url).netloc
+    with HTTP_SESSIONS_LOCK:
+        try:
+            session = HTTP_SESSIONS[host]
+        except KeyError:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=FETCH_WORKERS)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            HTTP_SESSIONS[host] = session
+    return session
+
+class Disk_Store:
+    """
+    Base class for the caches that are kept in SQLite files. Every thread gets its own
+    connection and the file runs in write-ahead-log mode, so any number of threads or
+    processes can read while another one writes.
+    """
+    schema = ""
+
+    def __init__(self,path):
+        self.path = path
+        self.local = threading.local()
+        self.connection().executescript(self.schema)
+
+    def connection(self):
+        """
+        Returns the connection for the current thread, opening it the first time.
+        """
+        try:
+            return self.local.connection
+        except AttributeError:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self.local.connection = connection
+            return connection
+
+    def close(self):
+        """
+        Closes the connection for the current thread.
+        """
+        try:
+            self.local.connection.close()
+            del self.local.connection
+        except AttributeError:
+            pass
+
+class Word_Store(Disk_Store):
+    """
+    The word classification cache. Words are looked up one at a time (or a batch at
+    a time) instead of loading the whole cache, and new classifications are committed
+    as soon as they are written so a crash doesn't lose them.
+
+    Records use the same layout as before: [name, syllables, part_of_speech, origins, ignore]
+
+    If a Lexicon_Snapshot is attached as snapshot, words are looked up in it first and
+    only the words it doesn't have are looked up in the database.
+    """
+    snapshot = None
+    schema = """
+    CREATE TABLE IF NOT EXISTS words (
+        name TEXT PRIMARY KEY,
+        syllables INTEGER,
+        part_of_speech TEXT,
+        origins TEXT,
+        ignore INTEGER
+    );
+    """
+
+    def __getitem__(self,word):
+        if self.snapshot is not None:
+            record = self.snapshot.get(word)
+            if record is not None:
+                return record
+        row = self.connection().execute(
+            "SELECT * FROM words WHERE name = ?", (word,)).fetchone()
+        if row is None:
+            raise KeyError(word)
+        return self.record_maker(row)
+
+    def __setitem__(self,word,record):
+        self.update({word: record})
+
+    def __contains__(self,word):
+        if self.snapshot is not None and word in self.snapshot:
+            return True
+        return self.connection().execute(
+            "SELECT 1 FROM words WHERE name = ?", (word,)).fetchone() is not None
+
+    def __len__(self):
+        return self.connection().execute("SELECT COUNT(*) FROM words").fetchone()[0]
+
+    @staticmethod
+    def record_maker(row):
+        return [row[0], row[1], row[2], json.loads(row[3]), bool(row[4])]
+
+    def get_many(self,words):
+        """
+        Looks up a batch of words.
+
+        Parameters
+        ----------
+        words (iterable of strings)
+
+        Returns
+        -------
+        dict of word -> record, for the words that are in the cache
+        """
+        words = list(words)
+        found = {}
+        if self.snapshot is not None:
+            found = self.snapshot.get_many(words)
+            words = [word for word in words if word not in found]
+        for i in range(0, len(words), 500): #SQLite limits the number of parameters
+            chunk = words[i:i+500]
+            rows = self.connection().execute(
+                f"SELECT * FROM words WHERE name IN ({','.join('?'*len(chunk))})", chunk)
+            for row in rows:
+                found[row[0]] = self.record_maker(row)
+        return found
+
+    def update(self,records):
+        """
+        Inserts or replaces a batch of records in one transaction.
+
+        Parameters
+        ----------
+        records (dict) word -> record
+        """
+        rows = [(word, record[1], record[2], json.dumps(record[3]), int(record[4]))
+                for word, record in records.items()]
+        with self.connection() as connection:
+            connection.executemany("INSERT OR REPLACE INTO words VALUES (?,?,?,?,?)", rows)
+
+    def records(self):
+        """
+        Every record in the database, in name order.
+        """
+        rows = self.connection().execute("SELECT * FROM words ORDER BY name")
+        return [self.record_maker(row) for row in rows]
+
+    def json_migrator(self,json_path):
+        """
+        One time import of the old word_cache.json file. Only runs when the store
+        is empty, so it is safe to call every time the store is opened.
+        """
+        if len(self) > 0:
+            return
+        try:
+            with open(json_path, 'r') as cache_file:
+                old_cache = json.loads(cache_file.read())
+        except (OSError, ValueError):
+            return
+        self.update(old_cache)
+
+class Lexicon_Snapshot:
+    """
+    A read-only copy of the word cache in one binary file that is memory-mapped instead
+    of read. Looking a word up doesn't parse anything or touch the database, and every
+    process that opens the file shares the same pages of memory.
+
+    File layout, all integers little-endian:
+        header      magic, version, record count, slot count, sizes of the two tables
+        records     one fixed-width record per word (RECORD struct)
+        slots       hash index, open addressing on the crc32 of the word, each slot is
+                    a record number plus one, 0 for an empty slot
+        pos table   the part of speech names, separated by NUL bytes
+        strings     the words, one after another, in UTF-8
+
+    A record is the offset and length of the word in the string table, the syllables
+    (-1 for None), the part of speech number, the origins bitmask (see origin_masker())
+    and the ignore flag.
+
+    Words classified after the snapshot was built are still found in the database.
+    """
+    MAGIC = b"WSLX"
+    VERSION = 1
+    HEADER = struct.Struct("<4sIIIII")
+    RECORD = struct.Struct("<IHhHBB")
+    SLOT = struct.Struct("<I")
+
+    def __init__(self,path):
+        self.path = path
+        with open(path, "rb") as snapshot_file:
+            self.map = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            magic, version, self.count, self.slot_count, pos_size, strings_size = self.HEADER.unpack_from(self.map)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f"{path} is not a version {self.VERSION} lexicon snapshot")
+            self.records_offset = self.HEADER.size
+            self.slots_offset = self.records_offset + self.count*self.RECORD.size
+            pos_offset = self.slots_offset + self.slot_count*self.SLOT.size
+            self.strings_offset = pos_offset + pos_size
+            if self.strings_offset + strings_size != len(self.map):
+                raise ValueError(f"{path} is truncated")
+            pos_table = self.map[pos_offset:self.strings_offset].decode("utf-8")
+            self.pos_names = pos_table.split("\0") if pos_table else []
+        except ValueError:
+            self.map.close()
+            raise
+        except struct.error:
+            self.map.close()
+            raise ValueError(f"{path} is truncated")
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self,word):
+        return self.record_number(word) is not None
+
+    def record_number(self,word):
+        """
+        The number of a word's record, or None if the word isn't in the snapshot.
+        """
+        if not self.slot_count:
+            return None
+        name = word.encode("utf-8")
+        mask = self.slot_count - 1
+        slot = zlib.crc32(name) & mask
+        while True:
+            number = self.SLOT.unpack_from(self.map, self.slots_offset + slot*self.SLOT.size)[0]
+            if number == 0:
+                return None
+            offset, length = struct.unpack_from("<IH", self.map, self.records_offset + (number-1)*self.RECORD.size)
+            start = self.strings_offset + offset
+            if length == len(name) and self.map[start:start+length] == name:
+                return number - 1
+            slot = (slot + 1) & mask
+
+    def get(self,word):
+        """
+        The word's record in the word cache layout, or None if it isn't in the snapshot.
+        """
+        number = self.record_number(word)
+        if number is None:
+            return None
+        offset, length, syllables, pos, mask, ignore = self.RECORD.unpack_from(
+            self.map, self.records_offset + number*self.RECORD.size)
+        origins = [lang for bit, lang in enumerate(ORIGIN_LANGUAGES) if mask >> bit & 1]
+        return [word, None if syllables < 0 else syllables, self.pos_names[pos], origins, bool(ignore)]
+
+    def get_many(self,words):
+        """
+        dict of word -> record, for the words that are in the snapshot.
+        """
+        found = {}
+        for word in words:
+            record = self.get(word)
+            if record is not None:
+                found[word] = record
+        return found
+
+    def close(self):
+        self.map.close()
+
+    @classmethod
+    def builder(cls,records,path):
+        """
+        Writes a snapshot of a list of word cache records. The file is written next to
+        path and then moved over it, so processes that have the old snapshot mapped
+        keep reading it undisturbed.
+
+        Parameters
+        ----------
+        records (list) [name, syllables, part_of_speech, origins, ignore] records
+        path (string)
+
+        Returns
+        -------
+        int, number of words in the snapshot
+        """
+        pos_names = list(dict.fromkeys(record[2] for record in records))
+        pos_numbers = {name: number for number, name in enumerate(pos_names)}
+        slot_count = 1
+        while slot_count < 2*len(records):
+            slot_count *= 2
+        slots = [0]*slot_count
+        strings = bytearray()
+        packed = bytearray()
+        for number, record in enumerate(records):
+            name = record[0].encode("utf-8")
+            syllables = -1 if record[1] is None else record[1]
+            packed += cls.RECORD.pack(len(strings), len(name), syllables, pos_numbers[record[2]],
+                                      origin_masker(record[3]), int(bool(record[4])))
+            strings += name
+            slot = zlib.crc32(name) & (slot_count - 1)
+            while slots[slot]:
+                slot = (slot + 1) & (slot_count - 1)
+            slots[slot] = number + 1
+        pos_table = "\0".join(pos_names).encode("utf-8")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as snapshot_file:
+            snapshot_file.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(records), slot_count,
+                                                len(pos_table), len(strings)))
+            snapshot_file.write(packed)
+            snapshot_file.write(struct.pack(f"<{slot_count}I", *slots))
+            snapshot_file.write(pos_table)
+            snapshot_file.write(strings)
+        os.replace(temp_path, path)
+        return len(records)
+
+class Article_Cache(Disk_Store):
+    """
+    Stores the extracted body text of articles, compressed, so that a repeated topic
+    skips both the download and the HTML parse. The total compressed size is kept
+    under max_bytes by evicting the least recently used articles, and articles older
+    than ttl seconds (if set) are treated as missing.
+    """
+    schema = """
+    CREATE TABLE IF NOT EXISTS articles (
+        url TEXT PRIMARY KEY,
+        body BLOB,
+        size INTEGER,
+        stored REAL,
+        used REAL
+    );
+    CREATE INDEX IF NOT EXISTS articles_used ON articles (used);
+    """
+
+    def __init__(self,path,max_bytes=ARTICLE_CACHE_MAX_BYTES,ttl=ARTICLE_CACHE_TTL):
+        super().__init__(path)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.counter_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def counter_adder(self,name,amount=1):
+        with self.counter_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def __getitem__(self,url):
+        now = time.time()
+        with self.connection() as connection:
+            row = connection.execute(
+                "SELECT body, stored FROM articles WHERE url = ?", (url,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                connection.execute("DELETE FROM articles WHERE url = ?", (url,))
+                row = None
+            if row is not None:
+                connection.execute("UPDATE articles SET used = ? WHERE url = ?", (now, url))
+        if row is None:
+            self.counter_adder("misses")
+            raise KeyError(url)
+        self.counter_adder("hits")
+        return zlib.decompress(row[0]).decode("utf-8")
+
+    def __setitem__(self,url,story_text):
+        body = zlib.compress(story_text.encode("utf-8"))
+        now = time.time()
+        with self.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO articles VALUES (?,?,?,?,?)",
+                               (url, body, len(body), now, now))
+            total = connection.execute("SELECT COALESCE(SUM(size),0) FROM articles").fetchone()[0]
+            if total > self.max_bytes:
+                evicted = []
+                for old_url, size in connection.execute(
+                        "SELECT url, size FROM articles WHERE url != ? ORDER BY used", (url,)):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append((old_url,))
+                    total -= size
+                connection.executemany("DELETE FROM articles WHERE url = ?", evicted)
+                self.counter_adder("evictions", len(evicted))
+
+    def stats(self):
+        """
+        Returns the hit, miss and eviction counters and the current size of the cache.
+        """
+        row = self.connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size),0) FROM articles").fetchone()
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "articles": row[0], "bytes": row[1]}
 
-import secrets
+def article_cache_getter():
+    """
+    Returns the shared article cache, opening it the first time it is needed.
+    """
+    global ARTICLE_CACHE
+    with ARTICLE_CACHE_LOCK:
+        if ARTICLE_CACHE is None:
+            ARTICLE_CACHE = Article_Cache(ARTICLE_CACHE_PATH)
+    return ARTICLE_CACHE
+
+class Trend_Cache(Disk_Store):
+    """
+    Stores the Ngram usage time series for each word, corpus and range of years so a
+    report for words that were already looked up doesn't need the network.
+    """
+    schema = """
+    CREATE TABLE IF NOT EXISTS trends (
+        word TEXT,
+        corpus INTEGER,
+        year_start INTEGER,
+        year_end INTEGER,
+        series TEXT,
+        PRIMARY KEY (word, corpus, year_start, year_end)
+    );
+    """
+
+    def get_many(self,words,corpus,year_start,year_end):
+        """
+        Returns a dict of word -> time series (list) for the words that are cached.
+        """
+        words = list(words)
+        found = {}
+        for i in range(0, len(words), 500):
+            chunk = words[i:i+500]
+            rows = self.connection().execute(
+                f"""SELECT word, series FROM trends WHERE corpus = ? AND year_start = ?
+                AND year_end = ? AND word IN ({','.join('?'*len(chunk))})""",
+                [corpus, year_start, year_end] + chunk)
+            for word, series in rows:
+                found[word] = json.loads(series)
+        return found
+
+    def update(self,series_dict,corpus,year_start,year_end):
+        """
+        Stores a dict of word -> time series in one transaction.
+        """
+        rows = [(word, corpus, year_start, year_end, json.dumps(series))
+                for word, series in series_dict.items()]
+        with self.connection() as connection:
+            connection.executemany("INSERT OR REPLACE INTO trends VALUES (?,?,?,?,?)", rows)
+
+def trend_cache_getter():
+    """
+    Returns the shared usage trend cache, opening it the first time it is needed.
+    """
+    global TREND_CACHE
+    with TREND_CACHE_LOCK:
+        if TREND_CACHE is None:
+            TREND_CACHE = Trend_Cache(TREND_CACHE_PATH)
+    return TREND_CACHE
+
+class Search_Metrics:
+    """
+    Timings and counters for one search: wall time of each pipeline stage, the number
+    and total latency of requests to each API, and the hits and misses of each cache.
+
+    Stages that run at the same time as each other (in the streaming pipeline) are
+    kept apart from the others, so they don't count twice towards the total.
+    """
+    def __init__(self,topic):
+        self.topic = topic
+        self.started = time.time()
+        self.stages = {} #stage -> seconds
+        self.overlapped_stages = {} #stage -> seconds spent in it, added up over every thread
+        self.requests = {} #api -> {"count", "seconds"}
+        self.caches = {} #cache -> {"hits", "misses"}
+        self.lock = threading.Lock()
+
+    def stage_adder(self,stage,seconds,overlapped=False):
+        stages = self.overlapped_stages if overlapped else self.stages
+        with self.lock:
+            stages[stage] = stages.get(stage, 0) + seconds
+
+    def request_adder(self,api,seconds):
+        with self.lock:
+            api_counts = self.requests.setdefault(api, {"count": 0, "seconds": 0.0})
+            api_counts["count"] += 1
+            api_counts["seconds"] += seconds
+
+    def cache_adder(self,cache,hits,misses):
+        with self.lock:
+            cache_counts = self.caches.setdefault(cache, {"hits": 0, "misses": 0})
+            cache_counts["hits"] += hits
+            cache_counts["misses"] += misses
+
+    def record(self):
+        """
+        Returns the metrics as a dict that can be saved as JSON.
+        """
+        with self.lock:
+            requests_record = {api: dict(counts, mean_seconds=counts["seconds"]/counts["count"])
+                               for api, counts in self.requests.items()}
+            caches_record = {}
+            for cache, counts in self.caches.items():
+                lookups = counts["hits"] + counts["misses"]
+                caches_record[cache] = dict(counts, hit_rate=counts["hits"]/lookups if lookups else None)
+            return {
+                "topic": self.topic,
+                "started": self.started,
+                "stages": dict(self.stages),
+                "total_seconds": sum(self.stages.values()),
+                "overlapped_stages": dict(self.overlapped_stages),
+                "requests": requests_record,
+                "caches": caches_record,
+            }
+
+    def log_writer(self,path):
+        """
+        Adds the record to the end of a JSON lines file.
+        """
+        with open(path, "a") as log_file:
+            log_file.write(json.dumps(self.record()) + "\n")
+
+@contextlib.contextmanager
+def search_metrics(topic):
+    """
+    Collects the metrics of everything run inside the with block into a new
+    Search_Metrics, which is yielded. When the block ends the record is added to
+    METRICS_LOG_PATH if it is set.
+    """
+    metrics = Search_Metrics(topic)
+    token = ACTIVE_METRICS.set(metrics)
+    try:
+        yield metrics
+    finally:
+        ACTIVE_METRICS.reset(token)
+        if METRICS_LOG_PATH is not None:
+            metrics.log_writer(METRICS_LOG_PATH)
+
+@contextlib.contextmanager
+def stage_timer(stage,overlapped=False):
+    """
+    Adds the wall time of the with block (or decorated function) to a stage of the
+    running search, if any. Overlapped stages are ones that run alongside others and
+    are kept apart from the search's total.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics = ACTIVE_METRICS.get()
+        if metrics is not None:
+            metrics.stage_adder(stage, time.perf_counter() - start, overlapped)
+
+def cache_counter(cache,hits=0,misses=0):
+    """
+    Counts cache hits and misses for the running search, if any.
+    """
+    metrics = ACTIVE_METRICS.get()
+    if metrics is not None:
+        metrics.cache_adder(cache, hits, misses)
+
+def api_get(api,url,**kwargs):
+    """
+    Sends a GET request on the shared session for the URL's host and records its
+    latency against api for the running search.
+
+    Parameter
+    ---------
+    api (string) name the request is counted under
+    url (string)
+    kwargs passed to requests
+
+    Return
+    ---------
+    response (requests.Response)
+    """
+    start = time.perf_counter()
+    response = http_session(url).get(url, **kwargs)
+    metrics = ACTIVE_METRICS.get()
+    if metrics is not None:
+        metrics.request_adder(api, time.perf_counter() - start)
+    return response
+
+def context_submitter(pool,function,*args):
+    """
+    Submits a function to a thread pool so it runs in a copy of the caller's context,
+    which keeps the requests it makes counted against the running search.
+    """
+    return pool.submit(contextvars.copy_context().run, function, *args)
+
+def window_submitter(submit,items,window):
+    """
+    Yields the result of submit(item) for each item, in order, with at most window
+    items submitted and not yet yielded at a time. Items are only taken from the
+    iterable as results are used, so a slow or very long iterable is never read far
+    ahead and finished results don't pile up waiting.
+
+    Parameters
+    ----------
+    submit (function) submit(item) returns a Future
+    items (iterable)
+    window (int)
+
+    Returns
+    ----------
+    generator of results
+    """
+    pending = deque()
+    for item in items:
+        pending.append(submit(item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+class Topic_Store(Disk_Store):
+    """
+    Remembers the counts and totals of the topics being refreshed, along with the
+    articles already counted, so a refresh only has to add what is new.
+    """
+    schema = """
+    CREATE TABLE IF NOT EXISTS topics (
+        topic TEXT PRIMARY KEY,
+        state TEXT,
+        updated REAL
+    );
+    """
+
+    def get(self,topic):
+        row = self.connection().execute("SELECT state FROM topics WHERE topic = ?", (topic,)).fetchone()
+        return None if row is None else json.loads(row[0])
 
-CACHE_DICT = {} #Temporary storage. Stores articles texts and topic results
+    def __setitem__(self,topic,state):
+        with self.connection() as connection:
+            connection.execute("INSERT OR REPLACE INTO topics VALUES (?,?,?)",
+                               (topic, json.dumps(state), time.time()))
 
 def word_cache_loader():
-    ''' Opens the cache file if it exists and loads the JSON into
-    the CACHE_DICT dictionary.
-    if the cache file doesn't exist, creates a new cache dictionary
+    ''' Opens the word cache database, creating it if it doesn't exist. The first
+    time it is created, the classifications in the old word_cache.json are copied in.
 
     Parameters
     ----------
@@ -24,33 +763,47 @@ def word_cache_loader():
 
     Returns
     -------
-    The opened cache: dict
+    The opened cache: Word_Store
     '''
+    word_cache = Word_Store(WORD_CACHE_PATH)
+    word_cache.json_migrator(WORD_CACHE_JSON)
     try:
-        cache_file = open('word_cache.json', 'r')
-        cache_contents = cache_file.read()
-        cache_dict = json.loads(cache_contents)
-        cache_file.close()
-    except:
-        cache_dict = {}
-    return cache_dict
+        word_cache.snapshot = Lexicon_Snapshot(LEXICON_SNAPSHOT_PATH)
+    except (OSError, ValueError):
+        pass #No snapshot yet, or one from another version, everything comes from the database
+    return word_cache
+
+def lexicon_snapshot_builder(word_cache,path=LEXICON_SNAPSHOT_PATH):
+    ''' Compiles every classification in the word cache into a Lexicon_Snapshot file,
+    which word_cache_loader() maps from then on.
+
+    Parameters
+    ----------
+    word_cache: Word_Store
+    path: string
+
+    Returns
+    -------
+    Number of words in the snapshot: int
+    '''
+    return Lexicon_Snapshot.builder(word_cache.records(), path)
 
 def word_cache_saver(word_cache):
-    ''' Saves the current state of the cache to disk
+    ''' Classifications are committed as they are stored, so all that is left to do
+    on exit is close the connection and the snapshot.
 
     Parameters
     ----------
-    word_cache: dict
-        The dictionary to save
+    word_cache: Word_Store
+        The cache to close
 
     Returns
     -------
     None
     '''
-    dumped_json_cache = json.dumps(word_cache)
-    fw = open('word_cache.json',"w")
-    fw.write(dumped_json_cache)
-    fw.close()
+    word_cache.close()
+    if word_cache.snapshot is not None:
+        word_cache.snapshot.close()
 
 class Topic_Results:
     def __init__(self,topic,sentence_count,word_count,word_dict):
@@ -60,53 +813,67 @@ class Topic_Results:
         self.word_dict = word_dict
 
         #Empty/Default values until updated by methods
-        self.word_objects = []
+        self.word_table = None #Word_Table, filled by word_list_builder
         self.search_number = 0
+        self.output_dir = "." #Where the charts are written
 
         self.most_used_word = "" #No restrictions
         self.most_popular_words = [] #Ignoring words to ignore
         self.most_popular_words_counts = []
         self.syllable_count = 0
+        self.polysyllable_count = 0 #Uses of words with three or more syllables
         self.origin_counts = {}
+        self.pos_counts = {}
         self.flesch_score = 0
+        self.readability = {} #Every readability_scores() metric for all the articles together
+        self.article_stats = [] #[sentences, words, syllables, polysyllables] of each article, in article_urls order
+        self.metrics = None #Search_Metrics, set by results_object_generator
+
+        self.article_urls = [] #Articles already counted in word_dict, in order
+        self.tail = "" #Last word of the text if it could continue into the next article
+        self.last_refreshed = None #YYYYMMDD of the last topic_refresher() run
+        self.count_bounds = None #word -> (low, high) real count, for approximate counts only
+
+    @property
+    def word_objects(self):
+        """
+        Word objects for every row of the word table. They are built on request,
+        the aggregations all work on the table directly.
+        """
+        if self.word_table is None:
+            return []
+        return self.word_table.word_objects_maker(self.word_dict)
 
     def __str__(self):
         return f"Search for {self.topic} returned {self.word_count} words in {self.sentence_count} sentences with a total of {self.syllable_count} syllables."
 
     def word_list_builder(self):
         """
-        Takes the word_dict of counts and creates a list of Word objects. The word 
+        Takes the word_dict of counts and fills the word table. The word 
         'name' and 'count are created and stored when the articles are parsed.
         This is combed with word classification information is stored in a cache
-        or can be collected by the word_classifer() function.
+        or is collected for all of the missing words at once by classify_words().
         """
-        progress_count = 0
-        for key, val in self.word_dict.items():
-            try:
-                classification_data = word_cache[key]
-            except KeyError:
-                classification_data = word_classifer(key)
-
-            name = classification_data[0]
-            syllables = classification_data[1]
-            part_of_speech = classification_data[2]
-            origins = classification_data[3]
-            ignore = classification_data[4]
-
-            new_word = Word(name,part_of_speech,syllables,origins,ignore)
-            new_word.counts = val
-            self.word_objects.append(new_word)
-            progress_count += 1
-            if progress_count%50 == 0:
-                print(f'Processed {progress_count} unique words.')
+        classify_words(self.word_dict.keys())
+        classifications = word_cache.get_many(self.word_dict.keys())
+        if self.word_table is None:
+            self.word_table = Word_Table()
+        self.word_table.rows_adder(self.word_dict, classifications)
+        print(f'Processed {len(self.word_table)} unique words.')
 
     def syllable_counter(self):
         """
         Counts the number of syllables. Used in computing reding scores.
+
+        With approximate counts only the most used words are in the table, so their
+        syllables per word are taken to hold for the whole text.
         """
-        for word in self.word_objects:
-            occurences = self.word_dict[word.word.lower()][3]
-            self.syllable_count += word.syllable*occurences
+        self.syllable_count = self.word_table.syllable_total()
+        self.polysyllable_count = self.word_table.polysyllable_total()
+        counted = int(self.word_table.counts[:,3].sum())
+        if self.count_bounds is not None and counted:
+            self.syllable_count = round(self.syllable_count*self.word_count/counted)
+            self.polysyllable_count = round(self.polysyllable_count*self.word_count/counted)
 
     def Flesch_reading_ease(self):
         """
@@ -120,81 +887,269 @@ class Topic_Results:
         30.0–10.0	College graduate	Very difficult to read. Best understood by university graduates.
         10.0–0.0	Professional	Extremely difficult to read. Best understood by university graduates
         https://en.wikipedia.org/wiki/Flesch%E2%80%93Kincaid_readability_tests
+
+        The other readability_scores() metrics are kept in self.readability.
+        """
+        if self.word_count == 0 or self.sentence_count == 0:
+            return #No text to score yet
+        self.readability = readability_scores(self.sentence_count, self.word_count,
+                                              self.syllable_count, self.polysyllable_count)
+        self.flesch_score = self.readability["flesch"]
+
+    def article_stats_adder(self,article_counts):
+        """
+        Adds the sentences, words, syllables and polysyllables of each new article to
+        article_stats. The sentences, words and uses of each word were counted when the
+        articles were parsed (see article_counter()). Each article is counted on its
+        own, so a word split across two articles is counted as two words here.
+
+        Every word's syllables are looked up once, from the word table, or the word
+        cache if the word isn't in the table, or syllable_estimates() if neither has
+        the word. The syllables and polysyllables of all the articles are then summed
+        with one np.bincount each.
+
+        Parameter
+        ---------
+        article_counts (iterable) article_counter() of each new article, in order
+        """
+        import numpy as np
+        article_counts = list(article_counts)
+        if not article_counts:
+            return
+        vocabulary, columns, uses = {}, [], []
+        for sentences, words, article_uses in article_counts:
+            columns.extend(vocabulary.setdefault(word, len(vocabulary)) for word in article_uses)
+            uses.extend(article_uses.values())
+        row_of, table_syllables = {}, np.zeros(0, dtype=np.int64)
+        if self.word_table is not None:
+            row_of = {name: row for row, name in enumerate(self.word_table.names)}
+            table_syllables = self.word_table.syllables
+        missing = [word for word in vocabulary if word not in row_of]
+        records = word_cache.get_many(missing)
+        unknown = [word for word in missing if records.get(word, [None, None])[1] is None]
+        estimates = syllable_estimates(unknown) if unknown else {}
+        word_syllables = np.fromiter(
+            (table_syllables[row_of[word]] if word in row_of else
+             estimates[word] if word in estimates else records[word][1] for word in vocabulary),
+            np.int64, len(vocabulary))
+
+        articles = np.repeat(np.arange(len(article_counts)),
+                             [len(article_uses) for sentences, words, article_uses in article_counts])
+        uses = np.array(uses, dtype=np.int64)
+        token_syllables = word_syllables[np.array(columns, dtype=np.int64)]
+        syllables = np.bincount(articles, weights=uses*token_syllables, minlength=len(article_counts))
+        polysyllables = np.bincount(articles, weights=uses*(token_syllables >= 3), minlength=len(article_counts))
+        for (sentences, words, article_uses), article_syllables, article_polysyllables in \
+                zip(article_counts, syllables.tolist(), polysyllables.tolist()):
+            self.article_stats.append([sentences, words, int(article_syllables), int(article_polysyllables)])
+
+    def article_readability(self):
+        """
+        Every readability_scores() metric for each article.
+
+        Returns
+        -------
+        dict of metric -> list of scores, in article_urls order (NaN for an article
+        without any sentences or words)
+        """
+        import numpy as np
+        if not self.article_stats:
+            return {}
+        sentences, words, syllables, polysyllables = np.array(self.article_stats, dtype=np.float64).T
+        return {metric: scores.tolist() for metric, scores in
+                readability_scores(sentences, words, syllables, polysyllables).items()}
+
+    def articles_folder(self,urls,texts):
+        """
+        Adds new articles to the results. Only the new text is parsed and only its
+        words are classified. The totals (syllables, origins, parts of speech) are
+        updated by the change, and the Flesch score and popular words are worked out
+        again from them.
+
+        Parameters
+        ----------
+        urls (list of strings) new article URLs, in order
+        texts (dict) url -> story text
+
+        Returns
+        -------
+        int, number of articles that were added
+        """
+        delta, article_counts = self.text_folder(urls, texts)
+        if delta:
+            classify_words(delta.keys())
+            self.delta_folder(delta)
+            if self.word_table is not None:
+                self.word_table.row_orderer(self.word_dict)
+        self.article_stats_adder(article_counts)
+        return len(article_counts)
+
+    def text_folder(self,urls,texts):
+        """
+        The first half of articles_folder(): parses the new articles and adds them to
+        the word_dict and the word, sentence and article counts. The totals that need
+        the words to be classified are left to delta_folder().
+
+        Parameters
+        ----------
+        urls (list of strings) new article URLs, in order
+        texts (dict) url -> story text
+
+        Returns
+        -------
+        delta (dict) the change to each word's counts
+        list, article_counter() of each article that was added
+        """
+        seen = set(self.article_urls)
+        new_urls = [url for url in dict.fromkeys(urls) if url not in seen]
+        parsed = [shard_parser(texts[url]) for url in new_urls]
+        article_counts = [article_counter(result) for result in parsed]
+        self.article_urls.extend(new_urls)
+        if not any(texts[url] for url in new_urls):
+            return {}, article_counts
+
+        #The last word counted may run on into the new text, so it is taken back
+        #out and counted again along with the new words. If the tail was its only
+        #use, it is dropped first and goes back in where the new text first uses it,
+        #so the word_dict keys stay in the order text_parser() would give them.
+        #The articles are parsed one by one and merged like shards, with the tail
+        #in front as a shard of its own.
+        tail_counts = word_counter([self.tail]) if self.tail else {}
+        sentence_delta, word_delta, added_counts, tail = shard_merger([(0, self.tail, None, "", 0), *parsed])
+        for word, counts in tail_counts.items():
+            old_counts = self.word_dict[word]
+            for i in range(4):
+                old_counts[i] -= counts[i]
+            if old_counts[3] == 0:
+                del self.word_dict[word]
+        for word, counts in added_counts.items():
+            try:
+                old_counts = self.word_dict[word]
+            except KeyError:
+                self.word_dict[word] = list(counts)
+                continue
+            for i in range(4):
+                old_counts[i] += counts[i]
+
+        delta = added_counts
+        for word, counts in tail_counts.items():
+            delta_counts = delta.setdefault(word, [0,0,0,0])
+            for i in range(4):
+                delta_counts[i] -= counts[i]
+        delta = {word: counts for word, counts in delta.items() if any(counts)}
+        self.sentence_count += sentence_delta
+        self.word_count += word_delta - (1 if self.tail else 0)
+        self.tail = tail
+        return delta, article_counts
+
+    def delta_folder(self,delta,table=True):
+        """
+        The second half of articles_folder(): adds a text_folder() delta to the
+        syllable, origin and part of speech totals and the word table, and works out
+        the Flesch score and popular words again. Every word in the delta has to be
+        in the word cache.
+
+        Parameters
+        ----------
+        delta (dict) word -> change to its counts
+        table (bool) False only updates the totals and the Flesch score, leaving the
+            word table and the popular words to be worked out once at the end
+        """
+        delta_table = Word_Table()
+        delta_table.rows_adder(delta, word_cache.get_many(delta.keys()))
+        self.syllable_count += delta_table.syllable_total()
+        self.polysyllable_count += delta_table.polysyllable_total()
+        for totals, delta_totals in ((self.origin_counts, delta_table.origin_totals()),
+                                     (self.pos_counts, delta_table.pos_totals())):
+            for key, value in delta_totals.items():
+                totals[key] = totals.get(key, 0) + value
+        self.Flesch_reading_ease()
+        if not table:
+            return
+        if self.word_table is not None:
+            self.word_table.table_merger(delta_table)
+        self.popular_words()
+
+    def state_maker(self):
+        """
+        Returns what is needed to refresh the topic later as a dict that can be saved as JSON.
+        """
+        return {
+            "article_urls": self.article_urls,
+            "tail": self.tail,
+            "sentence_count": self.sentence_count,
+            "word_count": self.word_count,
+            "word_dict": self.word_dict,
+            "syllable_count": self.syllable_count,
+            "polysyllable_count": self.polysyllable_count,
+            "origin_counts": self.origin_counts,
+            "pos_counts": self.pos_counts,
+            "article_stats": self.article_stats,
+            "last_refreshed": self.last_refreshed,
+        }
+
+    @classmethod
+    def state_loader(cls,topic,state):
         """
-        score = 206.835 - 1.1015*(self.word_count/self.sentence_count)-84.6*(self.syllable_count/self.word_count)
-        self.flesch_score = score
+        Rebuilds a Topic_Results from state_maker() output, without a word table.
+        """
+        results_object = cls(topic, state["sentence_count"], state["word_count"], state["word_dict"])
+        results_object.article_urls = state["article_urls"]
+        results_object.tail = state["tail"]
+        results_object.syllable_count = state["syllable_count"]
+        results_object.polysyllable_count = state.get("polysyllable_count", 0)
+        results_object.article_stats = state.get("article_stats", [])
+        results_object.last_refreshed = state.get("last_refreshed")
+        results_object.origin_counts = state["origin_counts"]
+        results_object.pos_counts = state["pos_counts"]
+        results_object.Flesch_reading_ease()
+        results_object.popular_words()
+        return results_object
+
+    def top_words(self,k,include_ignored=True,tie_break="first_seen"):
+        """
+        Ranks the words by total uses and returns the k most used.
 
-    def popular_words(self):
+        Parameters
+        ----------
+        k (int) number of words to return
+        include_ignored (bool) False leaves out the words on the ignore list
+        tie_break (string) see top_k_ranker()
+
+        Returns
+        -------
+        list of (word, count) tuples, most used first
+        """
+        table = self.word_table
+        if table is None: #Refreshed topics keep word_dict and the totals, not the table
+            entries = ((word, counts[3]) for word, counts in self.word_dict.items()
+                       if include_ignored or word not in words_to_ignore)
+            return top_k_ranker(entries, k, tie_break)
+        entries = zip(table.names, table.counts[:,3].tolist())
+        if not include_ignored:
+            entries = (entry for entry, ignore in zip(entries, table.ignore.tolist()) if not ignore)
+        return top_k_ranker(entries, k, tie_break)
+
+    def popular_words(self,k=5,tie_break="first_seen"):
         """
-        The the most used word (no restriction) and a list of the 5 most common
+        The the most used word (no restriction) and a list of the k most common
         words (excluding words form the ignore list)
         """
-        max = 0
-        max_ig = 0
-        ranks = {}
-        ranks_ignore = {}
-        for word in self.word_objects:
-            if word.ignore:
-                if word.counts[3] not in ranks_ignore.keys():
-                    ranks_ignore[word.counts[3]] = [word.word]
-                else:
-                    ranks_ignore[word.counts[3]].append(word.word)
-                if word.counts[3] > max_ig:
-                    max_ig = word.counts[3]
-            else:
-                if word.counts[3] not in ranks.keys():
-                    ranks[word.counts[3]] = [word.word]
-                else:
-                    ranks[word.counts[3]].append(word.word)
-                if word.counts[3] > max:
-                    max = word.counts[3]
-        self.most_used_word = ranks_ignore[max_ig][0]
-        if len(ranks[max]) > 5:
-            self.most_popular_words = ranks[max][:5]
-            self.most_popular_words_counts = [max,max,max,max,max]
-        else:
-            self.most_popular_words = ranks[max]
-            for x in ranks[max]:
-                self.most_popular_words_counts.append(max)
-            remaining = 5 - len(ranks[max])
-            for x in range(max):
-                if max-(x+1) in ranks.keys():
-                    if len(ranks[max-(x+1)]) > remaining:
-                        self.most_popular_words.extend(ranks[max-(x+1)][:remaining])
-                        for x in range(remaining):
-                            self.most_popular_words_counts.append(max-(x+1))
-                        break #Stop looking for more words
-                    else:
-                        self.most_popular_words.extend(ranks[max-(x+1)])
-                        for x in range(len(ranks[max-(x+1)])):
-                            self.most_popular_words_counts.append(max-(x+1))
+        top_all = self.top_words(1, True, tie_break)
+        self.most_used_word = top_all[0][0] if top_all else ""
+        top_kept = self.top_words(k, False, tie_break)
+        self.most_popular_words = [word for word, count in top_kept]
+        self.most_popular_words_counts = [count for word, count in top_kept]
 
     def origin_agreggator(self):
         """
         Agreggates the word origins into percentages, counts unique words.
         """
-        origin_counts = {
-            "Greek": 0,
-            "Latin": 0,
-            "French": 0,
-            "English": 0,
-            "German": 0,
-            "Norse" : 0,
-            "Other" : 0
-        }
-        for word in self.word_objects:
-            any_origin_count = 0
-            for key in origin_counts.keys():
-                if key in word.origins:
-                    origin_counts[key] += word.counts[3]
-                    any_origin_count += 1
-            if any_origin_count == 0:
-                origin_counts['Other'] += word.counts[3]
-        self.origin_counts = origin_counts
+        self.origin_counts = self.word_table.origin_totals()
 
-    def origins_bar_graph_maker(self):
+    def origins_bar_figure(self):
         """
-        Pulls the origins data and creates an HTML file with a bar graph using Plotly
+        Plotly bar graph of the origins data.
         """
         labels = []
         values = []
@@ -202,42 +1157,74 @@ class Topic_Results:
             labels.append(key)
             values.append(val)
 
-        fig = go.Figure(data=[go.Bar(x=labels, y=values)])
-        fig.write_html(f"originbar{self.search_number}.html", auto_open=False)
+        import plotly.graph_objects as go
+        return go.Figure(data=[go.Bar(x=labels, y=values)])
 
-    def pos_pie_graph_maker(self):
+    def origins_bar_graph_maker(self):
         """
-        Loops over word_objects to count parts of speech, then creates pie chart for that data
-        """
-        pos_dict = {
-            'adjective' : 0,
-            'noun' : 0,
-            'pronoun' : 0,
-            'preposition' : 0,
-            'verb' : 0,
-            'adverb' : 0,
-            'article' : 0,
-            'Other' : 0
-        }
-        for word in self.word_objects:
-            classified = 0
-            for key in pos_dict.keys():
-                if key in word.part_of_speech:
-                    pos_dict[key] += word.counts[3]
-                    classified += 1 #gaurantee that each word gets put into at least one category
-            if classified == 0:
-                pos_dict["Other"] += word.counts[3]
+        Pulls the origins data and creates an HTML file with a bar graph using Plotly
+        """
+        chart_file_writer(self.origins_bar_figure(), self.output_dir, f"originbar{self.search_number}.html")
+
+    def pos_agreggator(self):
+        """
+        Counts the uses of each part of speech.
+        """
+        self.pos_counts = self.word_table.pos_totals()
+
+    def pos_pie_figure(self):
+        """
+        Counts parts of speech (if they haven't been), then makes a Plotly pie chart for that data
+        """
+        if not self.pos_counts:
+            self.pos_agreggator()
+        pos_dict = self.pos_counts
 
         labels = []
         values = []
         for key,val in pos_dict.items():
             labels.append(key)
             values.append(val)
+        import plotly.graph_objects as go
         pie_data = go.Pie(labels=labels, values=values)
-        fig = go.Figure(data=pie_data)
-        fig.write_html(f"pospie{self.search_number}.html", auto_open=False)
+        return go.Figure(data=pie_data)
+
+    def pos_pie_graph_maker(self):
+        """
+        Creates an HTML file with the parts of speech pie chart
+        """
+        chart_file_writer(self.pos_pie_figure(), self.output_dir, f"pospie{self.search_number}.html")
+
+    def chart_fragments(self):
+        """
+        Both charts as HTML fragments to put straight into a page. The fragments don't
+        include plotly.js, the page has to load it once (see report_renderer()).
+
+        Returns
+        -------
+        dict with "pospie" and "originbar" HTML strings
+        """
+        config = {"responsive": True}
+        return {
+            "pospie": self.pos_pie_figure().to_html(full_html=False, include_plotlyjs=False, config=config,
+                                                    default_height=300, default_width=400,
+                                                    div_id=f"pospie{self.search_number}"),
+            "originbar": self.origins_bar_figure().to_html(full_html=False, include_plotlyjs=False, config=config,
+                                                           default_height=300, default_width=400,
+                                                           div_id=f"originbar{self.search_number}"),
+        }
+
+    def count_text(self,word,count):
+        """
+        A word's count for a report, or the range it is in for approximate counts.
+        """
+        if self.count_bounds is None or word not in self.count_bounds:
+            return str(count)
+        low, high = self.count_bounds[word]
+        return str(low) if low == high else f"{low} to {high}"
 
-    def html_report(self):
+    @stage_timer("report")
+    def html_report(self,chart_html=None):
         """
         Takes a results object and pulled out data and drops into a html table cell.
         Basically, it's madlibs. https://www.madlibs.com/
@@ -245,6 +1232,8 @@ class Topic_Results:
         Parameters:
         -----------
         results (Self)
+        chart_html (dict) optional chart_fragments() to put in the cell, by default
+            the chart files are shown in iframes
 
         Return:
         html_cell (string)
@@ -273,25 +1262,48 @@ class Topic_Results:
         reading Ease</A> score of {score}. That corresponds to something that is 
         written for {person}.
         """
+        if self.readability:
+            flesch_sentence += f"""
+            Their Flesch-Kincaid grade level is {self.readability["fk_grade"]:.1f}, their
+            Gunning fog index {self.readability["fog"]:.1f} and their SMOG grade {self.readability["smog"]:.1f}.
+            """
+        article_scores = self.article_readability().get("flesch", [])
+        ranked = sorted((score, url) for score, url in zip(article_scores, self.article_urls) if score == score)
+        if len(self.article_stats) == len(self.article_urls) and len(ranked) > 1:
+            flesch_sentence += f"""
+            The <A href="{escape(ranked[-1][1])}">easiest article</A> scores {ranked[-1][0]:.1f} and
+            the <A href="{escape(ranked[0][1])}">hardest</A> {ranked[0][0]:.1f}.
+            """
 
+        trends = usage_trends(self.most_popular_words)
         common_words_table = "<table>"
-        for x in range(5):
+        for x in range(len(self.most_popular_words)):
             word = self.most_popular_words[x]
-            results = usage_trend(word)
+            results = trends[word]
             common_words_table += f"""
-            <TR><TD><font size=5><B>{word}</B></font><BR>(Used {self.most_popular_words_counts[x]} times)</TD>
+            <TR><TD><font size=5><B>{escape(word)}</B></font><BR>(Used {self.count_text(word, self.most_popular_words_counts[x])} times)</TD>
             <TD><IMG SRC="z_{results[0]}.png" ALT='This word is {results[1]}' width=50 height=50></TD></TR>
             """
         common_words_table += "</table>"
 
+        if chart_html is None:
+            chart_html = {
+                "pospie": f'''<iframe src="pospie{self.search_number}.html"
+        height="300" width="400">
+        </iframe>''',
+                "originbar": f'''<iframe src="originbar{self.search_number}.html"
+        height="300" width="400">
+        </iframe>''',
+            }
+
         html_cell = f"""
         <TD WIDTH='425'>
-        <H1>{self.topic}</H1>
-        <p>Your search for {self.topic} yielded {self.word_count} words in {self.sentence_count}
+        <H1>{escape(self.topic)}</H1>
+        <p>Your search for {escape(self.topic)} yielded {self.word_count} words in {self.sentence_count}
         sentences. {flesch_sentence}</p>
         <HR>
         <P>
-        The most commonly used word is (not surprisingly) <B><I>{self.most_used_word}</I></B>,
+        The most commonly used word is (not surprisingly) <B><I>{escape(self.most_used_word)}</I></B>,
         but that is a pretty common word.
         </P>
         <P>
@@ -300,14 +1312,10 @@ class Topic_Results:
         {common_words_table}
         <HR>
         <p><B>Parts of Speech</B></p>
-        <iframe src="pospie{self.search_number}.html"
-        height="300" width="400">
-        </iframe>
+        {chart_html["pospie"]}
         <HR>
         <p><B>Lanuage of Origin</B></p>
-        <iframe src="originbar{self.search_number}.html"
-        height="300" width="400">
-        </iframe>
+        {chart_html["originbar"]}
         </TD>
         """
         return html_cell
@@ -321,6 +1329,172 @@ class Word:
         self.ignore = ignore
         self.counts = [0,0,0,0]
 
+ORIGIN_LANGUAGES = ("Greek", "Latin", "French", "English", "German", "Norse")
+POS_CATEGORIES = ("adjective", "noun", "pronoun", "preposition", "verb", "adverb", "article")
+
+class Word_Table:
+    """
+    The classified words of a topic stored by column instead of as one Word object per
+    word. Counts and syllables are NumPy arrays, parts of speech are codes into a table
+    of the part of speech names, and origins are a bitmask with one bit for each of
+    the ORIGIN_LANGUAGES. The aggregations used by the report are array reductions.
+    """
+    def __init__(self):
+        import numpy as np
+        self.names = []
+        self.counts = np.zeros((0,4), dtype=np.int64) #[lower, title, other, total]
+        self.syllables = np.zeros(0, dtype=np.int32)
+        self.pos_codes = np.zeros(0, dtype=np.int32)
+        self.origin_masks = np.zeros(0, dtype=np.uint8)
+        self.ignore = np.zeros(0, dtype=bool)
+        self.pos_names = [] #Part of speech for each code
+        self.pos_lookup = {} #Code for each part of speech
+
+    def __len__(self):
+        return len(self.names)
+
+    def pos_coder(self,part_of_speech):
+        try:
+            return self.pos_lookup[part_of_speech]
+        except KeyError:
+            self.pos_lookup[part_of_speech] = len(self.pos_names)
+            self.pos_names.append(part_of_speech)
+            return self.pos_lookup[part_of_speech]
+
+    def rows_adder(self,word_dict,classifications):
+        """
+        Appends a row for each word in word_dict.
+
+        Parameters
+        ----------
+        word_dict (dict) word -> [lower, title, other, total] counts
+        classifications (dict) word -> [name, syllables, part_of_speech, origins, ignore]
+        """
+        import numpy as np
+        records = [classifications[key] for key in word_dict]
+        size = len(records)
+        self.names.extend(record[0] for record in records)
+        self.counts = np.concatenate(
+            [self.counts, np.array(list(word_dict.values()), dtype=np.int64).reshape(size,4)])
+        self.syllables = np.concatenate(
+            [self.syllables, np.fromiter((record[1] for record in records), np.int32, size)])
+        self.pos_codes = np.concatenate(
+            [self.pos_codes, np.fromiter((self.pos_coder(record[2]) for record in records), np.int32, size)])
+        self.origin_masks = np.concatenate(
+            [self.origin_masks, np.fromiter((origin_masker(record[3]) for record in records), np.uint8, size)])
+        self.ignore = np.concatenate(
+            [self.ignore, np.fromiter((record[4] for record in records), bool, size)])
+
+    def table_merger(self,other):
+        """
+        Adds the counts of another table into this one. Words this table doesn't have
+        are appended, and words whose total drops to zero are removed.
+        """
+        import numpy as np
+        row_index = {name: row for row, name in enumerate(self.names)}
+        rows = np.array([row_index.get(name, -1) for name in other.names], dtype=np.int64)
+        known = rows >= 0
+        np.add.at(self.counts, rows[known], other.counts[known])
+
+        new = ~known
+        self.names.extend(name for name, is_new in zip(other.names, new.tolist()) if is_new)
+        self.counts = np.concatenate([self.counts, other.counts[new]])
+        self.syllables = np.concatenate([self.syllables, other.syllables[new]])
+        pos_codes = np.array([self.pos_coder(name) for name in other.pos_names], dtype=np.int32)
+        self.pos_codes = np.concatenate([self.pos_codes, pos_codes[other.pos_codes[new]]])
+        self.origin_masks = np.concatenate([self.origin_masks, other.origin_masks[new]])
+        self.ignore = np.concatenate([self.ignore, other.ignore[new]])
+
+        keep = self.counts[:,3] != 0
+        if not keep.all():
+            self.names = [name for name, kept in zip(self.names, keep.tolist()) if kept]
+            self.counts = self.counts[keep]
+            self.syllables = self.syllables[keep]
+            self.pos_codes = self.pos_codes[keep]
+            self.origin_masks = self.origin_masks[keep]
+            self.ignore = self.ignore[keep]
+
+    def row_orderer(self,names):
+        """
+        Puts the rows in the order of names, which has to hold every word in the table.
+        Merging tables keeps a word where it was first added, this puts the words back
+        in the order of the word_dict they were counted in.
+        """
+        import numpy as np
+        row_index = {name: row for row, name in enumerate(self.names)}
+        order = np.fromiter((row_index[name] for name in names if name in row_index), np.int64)
+        if len(order) != len(self.names) or (order == np.arange(len(order))).all():
+            return
+        self.names = [self.names[row] for row in order.tolist()]
+        self.counts = self.counts[order]
+        self.syllables = self.syllables[order]
+        self.pos_codes = self.pos_codes[order]
+        self.origin_masks = self.origin_masks[order]
+        self.ignore = self.ignore[order]
+
+    def syllable_total(self):
+        """
+        Total syllables over every use of every word.
+        """
+        import numpy as np
+        return int(np.dot(self.syllables.astype(np.int64), self.counts[:,3]))
+
+    def polysyllable_total(self):
+        """
+        Total uses of words with three or more syllables.
+        """
+        return int(self.counts[:,3][self.syllables >= 3].sum())
+
+    def origin_totals(self):
+        """
+        Uses of words from each language of origin. A word with several origins counts
+        for each of them, words with none count as "Other".
+        """
+        totals = self.counts[:,3]
+        origin_counts = {}
+        for bit, lang in enumerate(ORIGIN_LANGUAGES):
+            origin_counts[lang] = int(totals[(self.origin_masks >> bit) & 1 == 1].sum())
+        origin_counts["Other"] = int(totals[self.origin_masks == 0].sum())
+        return origin_counts
+
+    def pos_totals(self):
+        """
+        Uses of each part of speech category. A part of speech counts for every category
+        its name contains (so a "pronoun" is also a "noun"), and for "Other" if none.
+        """
+        import numpy as np
+        membership = np.array([[category in name for category in POS_CATEGORIES]
+                               for name in self.pos_names], dtype=np.int64).reshape(-1, len(POS_CATEGORIES))
+        code_totals = np.bincount(self.pos_codes, weights=self.counts[:,3],
+                                  minlength=len(self.pos_names)).astype(np.int64)
+        category_totals = code_totals @ membership
+        pos_counts = {category: int(total) for category, total in zip(POS_CATEGORIES, category_totals)}
+        pos_counts["Other"] = int(code_totals[membership.sum(axis=1) == 0].sum())
+        return pos_counts
+
+    def word_objects_maker(self,word_dict):
+        """
+        Builds a Word object for each row, sharing the count lists in word_dict.
+        """
+        word_objects = []
+        for row, name in enumerate(self.names):
+            origins = [lang for bit, lang in enumerate(ORIGIN_LANGUAGES) if self.origin_masks[row] >> bit & 1]
+            new_word = Word(name, self.pos_names[self.pos_codes[row]], int(self.syllables[row]),
+                            origins, bool(self.ignore[row]))
+            new_word.counts = word_dict[name]
+            word_objects.append(new_word)
+        return word_objects
+
+def origin_masker(origins):
+    """
+    Turns a list of origin languages into a bitmask, one bit per ORIGIN_LANGUAGES entry.
+    """
+    mask = 0
+    for bit, lang in enumerate(ORIGIN_LANGUAGES):
+        if lang in origins:
+            mask |= 1 << bit
+    return mask
+
 words_to_ignore = ("i", "a", "about", "above", "above", "across", "after", "afterwards", 
         "again", "against", "all", "almost", "alone", "along", "already", "also","although",
         "always","am","among", "amongst", "amoungst", "amount",  "an", "and", "another", 
@@ -359,135 +1533,1096 @@ words_to_ignore = ("i", "a", "about", "above", "above", "across", "after", "afte
         "why", "will", "with", "within", "without", "would", "yet", "you", "your",
         "yours", "yourself", "yourselves", "the")
 
-def article_url_fetcher(search_keyword):
+def top_k_ranker(entries,k,tie_break="first_seen"):
     """
-    For a given search term return a list of up to 10 URL's for related NYT Articles
+    Picks the k entries with the highest counts using a heap of size k, so ranking
+    n words costs O(n log k) instead of sorting all of them.
 
     Parameter
     ---------
-    search_keyword (string)
+    entries (iterable of (word, count) tuples) in the order the words were first seen
+    k (int)
+    tie_break (string) how to order words with the same count,
+        "first_seen" keeps the order of entries, "alphabetical" sorts them by word
 
     Return
     ---------
-    url_list (list)
+    list of (word, count) tuples, highest count first
     """
-    print(f"Looking up articles for {search_keyword}.")
-    key = secrets.nytimes
-    params = {
-        'q' : search_keyword,
-        'api-key' : key
-    }
-    response = requests.get("https://api.nytimes.com/svc/search/v2/articlesearch.json",params=params)
-    returned_response = json.loads(response.text)
-    url_list = []
-    for x in returned_response["response"]["docs"]:
-        article_url = x["web_url"]
-        url_list.append(article_url)
-    return url_list
+    if tie_break == "first_seen":
+        ranked = heapq.nsmallest(k, ((-count, index, word) for index, (word, count) in enumerate(entries)))
+        return [(word, -count) for count, index, word in ranked]
+    elif tie_break == "alphabetical":
+        ranked = heapq.nsmallest(k, ((-count, word) for word, count in entries))
+        return [(word, -count) for count, word in ranked]
+    else:
+        raise ValueError(f"Unknown tie_break: {tie_break}")
 
-def article_text_collector(url,cache=CACHE_DICT):
+def readability_scores(sentences,words,syllables,polysyllables):
     """
-    For a URL, the function checks to see if the story has been cached. It has not
-    been cached, the function gets the article, searches for body pargraphs and then
-    creates one a single string of the body of the article.
+    Works out four readability metrics at once. The counts can be numbers, for one
+    text, or numpy arrays with one entry per text, and the scores come back the same
+    way. A text without any sentences or words scores NaN.
+    https://en.wikipedia.org/wiki/Flesch%E2%80%93Kincaid_readability_tests
+    https://en.wikipedia.org/wiki/Gunning_fog_index
+    https://en.wikipedia.org/wiki/SMOG
+
+    Parameters
+    ----------
+    sentences, words, syllables (number or array)
+    polysyllables (number or array) uses of words with three or more syllables
+
+    Returns
+    ----------
+    dict with "flesch" (reading ease), "fk_grade" (Flesch-Kincaid grade level),
+    "fog" (Gunning fog index) and "smog" (SMOG grade)
+    """
+    import numpy as np
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sentences = np.where(np.asarray(sentences) > 0, sentences, np.nan)
+        words = np.where(np.asarray(words) > 0, words, np.nan)
+        words_per_sentence = words/sentences
+        syllables_per_word = syllables/words
+        scores = {
+            "flesch": 206.835 - 1.015*words_per_sentence - 84.6*syllables_per_word,
+            "fk_grade": 0.39*words_per_sentence + 11.8*syllables_per_word - 15.59,
+            "fog": 0.4*(words_per_sentence + 100*polysyllables/words),
+            "smog": 1.0430*np.sqrt(polysyllables*30/sentences) + 3.1291,
+        }
+    if scores["flesch"].ndim == 0:
+        return {metric: float(score) for metric, score in scores.items()}
+    return scores
+
+def article_url_fetcher(search_keyword,target_count=None,begin_date=None,end_date=None,sort=None):
+    """
+    For a given search term return a list of up to target_count URL's for related NYT Articles
 
     Parameter
     ---------
-    url (string)
+    search_keyword (string)
+    target_count (int) optional, defaults to SEARCH_ARTICLE_COUNT
+    begin_date, end_date (string) optional YYYYMMDD limits, default to SEARCH_BEGIN_DATE and SEARCH_END_DATE
+    sort (string) optional "newest", "oldest" or "relevance", defaults to the API's relevance order
 
     Return
     ---------
-    story_text (string)
+    url_list (list)
     """
-    try:
-        story_text = cache[url]
-    except KeyError:
-        response = requests.get(url)
-        soup = BeautifulSoup(response.text, "html.parser")
-        story = soup.find_all('p', class_='css-axufdj evys1bk0')
-        story_text  = ""
-        for section in story:
-            if section.string is not None:
-                story_text += section.string
-        cache[url] = story_text
+    return list(article_url_pager(search_keyword,target_count,begin_date,end_date,sort))
+
+def article_url_pager(search_keyword,target_count=None,begin_date=None,end_date=None,sort=None):
+    """
+    Pages through the NYT article search, yielding article URLs as each page arrives,
+    until target_count URLs have been found or the results run out. Every page request
+    waits for a token from NYT_RATE_LIMITER, which is shared by every search in the
+    process, so paging never goes over the API's rate limit.
+
+    Parameter
+    ---------
+    search_keyword (string)
+    target_count (int) optional, defaults to SEARCH_ARTICLE_COUNT
+    begin_date, end_date (string) optional YYYYMMDD limits, default to SEARCH_BEGIN_DATE and SEARCH_END_DATE
+    sort (string) optional "newest", "oldest" or "relevance"
+
+    Return
+    ---------
+    generator of URLs (strings)
+    """
+    target_count = target_count or SEARCH_ARTICLE_COUNT
+    begin_date = begin_date or SEARCH_BEGIN_DATE
+    end_date = end_date or SEARCH_END_DATE
+    print(f"Looking up articles for {search_keyword}.")
+    key = api_key("nytimes")
+    params = {
+        'q' : search_keyword,
+        'api-key' : key
+    }
+    if begin_date:
+        params['begin_date'] = begin_date
+    if end_date:
+        params['end_date'] = end_date
+    if sort:
+        params['sort'] = sort
+
+    found = 0
+    for page in range(NYT_MAX_PAGES):
+        params['page'] = page
+        returned_response = nyt_page_getter(params)
+        docs = returned_response["response"]["docs"]
+        for x in docs:
+            yield x["web_url"]
+            found += 1
+            if found >= target_count:
+                return
+        hits = returned_response["response"].get("meta", {}).get("hits", 0)
+        if len(docs) < NYT_PAGE_SIZE or (page+1)*NYT_PAGE_SIZE >= hits:
+            return
+
+def nyt_page_getter(params):
+    """
+    Gets one page of article search results under NYT_RATE_LIMITER. When the API says
+    it is rate limited (429) or has a server error, the request is tried again after a
+    backoff, up to NYT_RETRIES times. A Retry-After header from the API is used as
+    the wait if it is given.
+
+    Parameter
+    ---------
+    params (dict) search parameters, including the page
+
+    Return
+    ---------
+    the decoded search response (dict)
+    """
+    backoff = NYT_BACKOFF_SECONDS
+    for attempt in range(NYT_RETRIES + 1):
+        NYT_RATE_LIMITER.acquire()
+        response = api_get("nytimes",NYT_SEARCH_URL,params=params)
+        if response.status_code != 429 and response.status_code < 500:
+            break
+        if attempt == NYT_RETRIES:
+            break
+        retry_after = response.headers.get("Retry-After", "")
+        wait = int(retry_after) if retry_after.isdigit() else backoff
+        print(f"Article search returned {response.status_code}, trying again in {wait} seconds.")
+        time.sleep(wait)
+        backoff *= 2
+    response.raise_for_status()
+    return json.loads(response.text)
+
+def article_search_collector(search_keyword,target_count=None,begin_date=None,end_date=None):
+    """
+    Searches for articles and downloads them at the same time: the articles on each
+    page of results start downloading while the next page is waiting for its turn
+    under the rate limit. The bodies are left in the article cache.
+
+    Parameter
+    ---------
+    search_keyword (string)
+    target_count (int) optional, defaults to SEARCH_ARTICLE_COUNT
+    begin_date, end_date (string) optional YYYYMMDD limits
+
+    Return
+    ---------
+    url_list (list)
+    """
+    url_list = []
+    def recorded_pages():
+        for url in article_url_pager(search_keyword,target_count,begin_date,end_date):
+            url_list.append(url)
+            yield url
+    article_texts_collector(recorded_pages())
+    return url_list
+
+class Token_Bucket:
+    """
+    Rate limiter shared by threads. Tokens are added at rate per second up to
+    capacity, and acquire() waits until one is available.
+    """
+    def __init__(self,rate,capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated)*self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens)/self.rate
+            time.sleep(wait)
+
+#A capacity of 1 spaces the requests evenly, a bigger one would allow a burst on
+#top of the steady rate and go over the per minute limit
+NYT_RATE_LIMITER = Token_Bucket(NYT_REQUESTS_PER_MINUTE/60, 1)
+
+def article_text_collector(url,cache=None):
+    """
+    For a URL, the function checks to see if the story has been cached. It has not
+    been cached, the function gets the article, searches for body pargraphs and then
+    creates one a single string of the body of the article. Only the text of a
+    successful response is cached, a failed request gives an empty string.
+
+    Parameter
+    ---------
+    url (string)
+    cache (Article_Cache or dict) optional, defaults to the shared article cache
+
+    Return
+    ---------
+    story_text (string)
+    """
+    if cache is None:
+        cache = article_cache_getter()
+    try:
+        story_text = cache[url]
+        cache_counter("article", hits=1)
+    except KeyError:
+        cache_counter("article", misses=1)
+        response = api_get("article",url,stream=ARTICLE_EXTRACTOR != "soup")
+        if not response.ok:
+            #Left out of the cache so the article is tried again next time
+            print(f"Could not get {url} ({response.status_code}), skipping it.")
+            response.close()
+            return ""
+        if ARTICLE_EXTRACTOR == "soup":
+            story_text = soup_text_extractor(response.text)
+        else:
+            story_text = stream_text_extractor(response)
+        cache[url] = story_text
+    return story_text
+
+def soup_text_extractor(html,selector=None):
+    """
+    Builds a BeautifulSoup tree for a page and joins the text of the body paragraphs.
+    Paragraphs that contain anything besides one piece of text are skipped.
+
+    Parameter
+    ---------
+    html (string)
+    selector (tuple) (tag, class), defaults to ARTICLE_PARAGRAPH_SELECTOR
+
+    Return
+    ---------
+    story_text (string)
+    """
+    from bs4 import BeautifulSoup
+    tag, css_class = selector or ARTICLE_PARAGRAPH_SELECTOR
+    soup = BeautifulSoup(html, "html.parser")
+    story = soup.find_all(tag, class_=css_class)
+    story_text  = ""
+    for section in story:
+        if section.string is not None:
+            story_text += section.string
     return story_text
 
-def search_word_grouper(url_list):
+def stream_text_extractor(response,selector=None):
+    """
+    Reads a streamed response ARTICLE_CHUNK_SIZE bytes at a time and feeds it to a
+    Paragraph_Extractor, so the page is never held or parsed as a whole tree. Gives
+    the same text as soup_text_extractor().
+
+    Parameter
+    ---------
+    response (requests.Response) opened with stream=True
+    selector (tuple) (tag, class), defaults to ARTICLE_PARAGRAPH_SELECTOR
+
+    Return
+    ---------
+    story_text (string)
+    """
+    extractor = Paragraph_Extractor(selector)
+    decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+    for chunk in response.iter_content(chunk_size=ARTICLE_CHUNK_SIZE):
+        extractor.feed(decoder.decode(chunk))
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    return extractor.story_text()
+
+#Tags html.parser reports without an end tag, closed as soon as they open
+VOID_ELEMENTS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "keygen",
+                 "link", "menuitem", "meta", "param", "source", "track", "wbr", "basefont",
+                 "bgsound", "command", "frame", "image", "isindex", "nextid", "spacer"}
+
+class Paragraph_Extractor(HTMLParser):
+    """
+    Incremental HTML parser that only keeps the paragraphs matching a (tag, class)
+    selector. It tracks the names of the open tags for the whole page, but only
+    builds nodes inside matching paragraphs, and reduces each paragraph to its text
+    when it closes. Tags are closed the same way BeautifulSoup closes them, so
+    paragraphs that hold more than a single string are skipped like section.string
+    being None.
+    """
+    def __init__(self,selector=None):
+        super().__init__(convert_charrefs=True)
+        self.tag, self.css_class = selector or ARTICLE_PARAGRAPH_SELECTOR
+        self.stack = [] #[tag name, node or None] for each open tag
+        self.paragraphs = [] #Text of each matching paragraph in page order, None if skipped
+
+    def class_matcher(self,attrs):
+        for name, value in attrs:
+            if name == "class" and value is not None:
+                classes = value.split()
+                return " ".join(classes) == self.css_class or self.css_class in classes
+        return False
+
+    def handle_starttag(self,tag,attrs):
+        parent = self.stack[-1][1] if self.stack else None
+        node = None
+        if tag == self.tag and self.class_matcher(attrs):
+            node = {"children": [], "slot": len(self.paragraphs)}
+            self.paragraphs.append(None)
+        elif parent is not None:
+            node = {"children": [], "slot": None}
+        if parent is not None:
+            parent["children"].append(node)
+        self.stack.append([tag, node])
+        if tag in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_startendtag(self,tag,attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_ELEMENTS:
+            self.handle_endtag(tag)
+
+    def handle_endtag(self,tag):
+        for depth in range(len(self.stack)-1, -1, -1):
+            if self.stack[depth][0] == tag:
+                while len(self.stack) > depth:
+                    self.node_closer(self.stack.pop()[1])
+                return
+
+    def node_closer(self,node):
+        if node is not None and node["slot"] is not None:
+            self.paragraphs[node["slot"]] = node_string(node)
+
+    def handle_data(self,data):
+        if self.stack and self.stack[-1][1] is not None:
+            children = self.stack[-1][1]["children"]
+            if children and isinstance(children[-1], str):
+                children[-1] += data #Text split across chunks is still one string
+            else:
+                children.append(data)
+
+    def handle_comment(self,data):
+        if self.stack and self.stack[-1][1] is not None:
+            self.stack[-1][1]["children"].append(("comment", data))
+
+    def close(self):
+        super().close()
+        while self.stack:
+            self.node_closer(self.stack.pop()[1])
+
+    def story_text(self):
+        return "".join(text for text in self.paragraphs if text is not None)
+
+def node_string(node):
+    """
+    The single string inside a node, following nodes with one child, or None if the
+    node holds anything else. Works like BeautifulSoup's Tag.string.
+    """
+    children = node["children"]
+    if len(children) != 1:
+        return None
+    child = children[0]
+    if isinstance(child, str):
+        return child
+    elif isinstance(child, tuple):
+        return child[1]
+    else:
+        return node_string(child)
+
+def search_word_grouper(url_list,max_workers=FETCH_WORKERS):
     """
     For a list of URL, the function use the article_text_collector() to collect
     the body of each article. Then, this function further complies the bodies into one
     long string
 
+    Articles are downloaded at the same time by a pool of up to max_workers threads.
+    The bodies are still joined in the order of url_list, so the combined text is the
+    same as downloading them one after another.
+
     Parameter
     ---------
     url_list (list of strings)
+    max_workers (int) maximum number of concurrent downloads, 1 downloads in order
 
     Return
     ---------
     seach_word_text (string) combined boby text for a given search word
     """
-    search_word_text = ""
-    for url in url_list:
-        search_word_text += article_text_collector(url)
+    url_list = list(url_list)
+    texts = article_texts_collector(url_list,max_workers)
+    search_word_text = "".join(texts[url] for url in url_list)
     return search_word_text
 
+def article_texts_collector(url_list,max_workers=FETCH_WORKERS):
+    """
+    Collects the body of every article in a list with article_text_collector(), using
+    a pool of up to max_workers threads. Each URL is only collected once. url_list can
+    be a generator, each article starts downloading as soon as its URL comes out.
+
+    Parameter
+    ---------
+    url_list (iterable of strings)
+    max_workers (int) maximum number of concurrent downloads, 1 downloads in order
+
+    Return
+    ---------
+    texts (dict) url -> story text
+    """
+    if max_workers <= 1:
+        return {url: article_text_collector(url) for url in dict.fromkeys(url_list)}
+    futures = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        for url in url_list:
+            if url not in futures:
+                futures[url] = context_submitter(pool, article_text_collector, url)
+        texts = {url: future.result() for url, future in futures.items()}
+    return texts
+
+def article_text_streamer(url_list,max_workers=FETCH_WORKERS):
+    """
+    Like article_texts_collector(), but yields the bodies in url_list order as they
+    arrive instead of returning them all at the end. Each URL is only collected once.
+    Only twice max_workers downloads are started ahead of the text being used, so the
+    bodies waiting to be used stay within that window.
+
+    Parameter
+    ---------
+    url_list (iterable of strings)
+    max_workers (int) maximum number of concurrent downloads
+
+    Return
+    ---------
+    generator of story texts (strings)
+    """
+    collect = stage_timer("text_collection", overlapped=True)(article_text_collector)
+    seen = set()
+    new_urls = (seen.add(url) or url for url in url_list if url not in seen)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        yield from window_submitter(lambda url: context_submitter(pool, collect, url), new_urls, 2*max_workers)
+
+#Drops punctuation and digits. Sentence endings become spaces because the
+#paragraphs are sometimes run into each other.
+PUNCTUATION_TABLE = str.maketrans(
+    dict.fromkeys("1234567890@#$%^&*()-+_=[],:;/'"+'"'+'“”—') | dict.fromkeys(".?!", " "))
+
+def text_tokenizer(articles):
+    """
+    Removes punctuation from a block of text, counts the sentences and splits what is
+    left into words.
+
+    Parameter
+    ---------
+    articles (string)
+
+    Return
+    ---------
+    sentence_count (int)
+    words (list of strings)
+    """
+    sentence_count = articles.count(".") + articles.count("?") + articles.count("!")
+    words = articles.translate(PUNCTUATION_TABLE).split()
+    return sentence_count, words
+
+def word_counter(words,word_dict=None):
+    """
+    Counts a list of words into a word_dict keyed by the lowercase word. Each entry
+    is [lowercase uses, titlecase uses, other uses, total uses].
+
+    Parameter
+    ---------
+    words (list of strings)
+    word_dict (dict) optional, existing counts to add to
+
+    Return
+    ---------
+    word_dict (dict)
+    """
+    if word_dict is None:
+        word_dict = {}
+    #Counter keeps the order each spelling was first seen in, so the word_dict
+    #keys come out in the same order as counting the words one at a time.
+    for word, uses in Counter(words).items():
+        key = word.lower()
+        counts = word_dict.get(key)
+        if counts is None:
+            counts = word_dict[key] = [0,0,0,0]
+        if word.islower():
+            counts[0] += uses
+        elif word.istitle():
+            counts[1] += uses
+        else:
+            counts[2] += uses
+        counts[3] += uses
+    return word_dict
+
 def text_parser(articles,search_keyword,cache=CACHE_DICT):
     """
-    Given the combine 
+    Given the combined text of the articles for a search, counts the sentences, the
+    words and the uses of each word and stores them in a new Topic_Results object.
 
     Parameter
     ---------
     articles (string)
+    search_keyword (string)
 
     Return
     ---------
     Results article
     """
-    #Phase 1, eliminate puntucation.
-    no_punctuation = ""
-    sentence_count = 0
-    for x in articles:
-        if x in "1234567890@#$%^&*()-+_=[],:;/'"+'"'+'“”—':
-            pass
-        elif x in ".?!":
-            sentence_count += 1
-            no_punctuation += " " #The paragraphs are sometimes run into each other.
+    sentence_count, words = text_tokenizer(articles)
+    word_dict = word_counter(words)
+    cache[search_keyword] = Topic_Results(search_keyword,sentence_count,len(words),word_dict)
+    return cache[search_keyword]
+
+def tail_fragment(articles):
+    """
+    The last word of a block of text if nothing separates it from whatever text comes
+    next, otherwise an empty string. When more articles are added, this word is joined
+    to the start of the next article the same way search_word_grouper() joins them.
+    """
+    translated = articles.translate(PUNCTUATION_TABLE)
+    if translated and not translated[-1].isspace():
+        return translated.split()[-1]
+    return ""
+
+def text_sharder(texts,shard_size=PARSE_SHARD_SIZE):
+    """
+    Groups a run of article texts into shards of about shard_size characters. Short
+    articles are put together in one shard, and an article is never cut, so one
+    longer than shard_size is a shard on its own. Each article is parsed on its own
+    (see articles_parser()), so its counts can be kept for article_stats.
+
+    Parameters
+    ----------
+    texts (iterable of strings) article texts, in order
+    shard_size (int)
+
+    Returns
+    ----------
+    generator of lists of strings
+    """
+    shard, size = [], 0
+    for text in texts:
+        shard.append(text)
+        size += len(text)
+        if size >= shard_size:
+            yield shard
+            shard, size = [], 0
+    if shard:
+        yield shard
+
+def shard_parser(shard):
+    """
+    Parses one shard of a topic's text in a parse worker. The first and last words of
+    the shard are kept out of the counts, since they may be the ends of words cut in
+    two by the sharding; shard_merger() puts them back together.
+
+    Parameter
+    ---------
+    shard (string)
+
+    Return
+    ---------
+    (sentence_count, head, word_dict, tail, word_count). head is the text before the
+    first space and tail the text after the last one, "" if the shard starts or ends
+    with a space. If the shard has no spaces at all, word_dict is None and the whole
+    shard is in head.
+    """
+    sentence_count = shard.count(".") + shard.count("?") + shard.count("!")
+    translated = shard.translate(PUNCTUATION_TABLE)
+    words = translated.split()
+    if not translated or len(words) == 1 and not (translated[0].isspace() or translated[-1].isspace()):
+        return sentence_count, translated, None, "", 0
+    head = words.pop(0) if not translated[0].isspace() else ""
+    tail = words.pop() if not translated[-1].isspace() else ""
+    return sentence_count, head, word_counter(words), tail, len(words)
+
+def articles_parser(shard):
+    """
+    Parses each article of a text_sharder() shard on its own with shard_parser(), in
+    a parse worker.
+    """
+    return [shard_parser(text) for text in shard]
+
+def article_counter(parsed):
+    """
+    The counts of one article for Topic_Results.article_stats_adder(), from its
+    shard_parser() result. The first and last words are counted here too, since an
+    article's stats count it on its own. Call it before shard_merger() adds the
+    result, the merge changes its word_dict.
+
+    Parameter
+    ---------
+    parsed (tuple) shard_parser() result for the whole article
+
+    Return
+    ---------
+    (sentence_count, word_count, uses), uses is lowercase word -> uses in the article
+    """
+    sentence_count, head, word_dict, tail, word_count = parsed
+    uses = Counter({word: counts[3] for word, counts in (word_dict or {}).items()})
+    for word in (head, tail):
+        if word:
+            uses[word.lower()] += 1
+            word_count += 1
+    return sentence_count, word_count, uses
+
+def word_dict_adder(word_dict,other):
+    """
+    Adds the counts of one word_dict to another, in place. New words go at the end.
+    """
+    for word, counts in other.items():
+        old_counts = word_dict.get(word)
+        if old_counts is None:
+            word_dict[word] = counts
         else:
-            no_punctuation += x
+            for i in range(4):
+                old_counts[i] += counts[i]
 
-    articles_as_word_list = no_punctuation.split()
-    word_count = 0
+def shard_merger(shard_results,word_dict=None,adder=word_dict_adder):
+    """
+    Adds the counts of parsed shards together, in the order of the shards. The tail of
+    each shard is joined to the head of the next one and counted as one word, the same
+    as parsing the text in one piece. Sentences are counted by their end marks, so a
+    sentence running over two shards is still only counted once.
 
-    word_dict = {}
-    for word in articles_as_word_list:
+    Parameters
+    ----------
+    shard_results (iterable) shard_parser() results, in order
+    word_dict (object) optional, what the counts are added to, a new dict by default
+    adder (function) adder(word_dict, counts) adds a word_dict of counts to word_dict
+
+    Returns
+    ----------
+    sentence_count (int)
+    word_count (int)
+    word_dict (object)
+    tail (string) the last word if nothing follows it, like tail_fragment()
+    """
+    if word_dict is None:
+        word_dict = {}
+    sentence_count, word_count, carry = 0, 0, ""
+    for shard_sentences, head, shard_dict, tail, shard_words in shard_results:
+        sentence_count += shard_sentences
+        if shard_dict is None:
+            carry += head
+            continue
+        if carry + head:
+            adder(word_dict, word_counter([carry + head]))
+            word_count += 1
+        adder(word_dict, shard_dict)
+        word_count += shard_words
+        carry = tail
+    if carry:
+        adder(word_dict, word_counter([carry]))
         word_count += 1
-        word = word.strip()
-        if word.lower() in word_dict.keys():
-            if word.islower():
-                word_dict[word.lower()][0] += 1
-            elif word.istitle():
-                word_dict[word.lower()][1] +=1
-            else:
-                word_dict[word.lower()][2] +=1
-            word_dict[word.lower()][3] +=1
-        else:
-            word_dict[word.lower()]=[0,0,0,0]
-            if word.islower():
-                word_dict[word.lower()][0] += 1
-            elif word.istitle():
-                word_dict[word.lower()][1] +=1
-            else:
-                word_dict[word.lower()][2] +=1
-            word_dict[word.lower()][3] +=1
+    return sentence_count, word_count, word_dict, carry
+
+def sharded_text_parser(texts,search_keyword,workers=None,cache=CACHE_DICT,approximate=False,article_counts=None):
+    """
+    Does the same as text_parser(), but without joining the articles into one string.
+    The texts are grouped into shards whose articles are tokenized and counted on a
+    pool of worker processes, and the shard counts are merged into one Topic_Results object. The
+    results, including the order of the word_dict, are the same as text_parser().
+
+    With approximate=True the shard counts go into a Heavy_Hitters counter instead,
+    so memory stays the same however many distinct words there are. Only the
+    HEAVY_HITTERS most used words are kept in the word_dict, with their guaranteed
+    counts, and the range each count could be in is kept in count_bounds. The word
+    and sentence counts are still exact.
 
+    Parameters
+    ----------
+    texts (iterable of strings) article texts, in order
+    search_keyword (string)
+    workers (int) optional, size of the process pool, defaults to PARSE_WORKERS
+    approximate (bool)
+    article_counts (list) optional, article_counter() of each article is added to it
+
+    Returns
+    ----------
+    Results object, with its tail set
+    """
+    global PARSE_POOL, PARSE_POOL_SIZE
+    workers = PARSE_WORKERS if workers is None else workers
+    shards = text_sharder(texts)
+    if workers <= 1:
+        parsed_shards = map(articles_parser, shards)
+    else:
+        #Executor.map would read every shard (and so every article) before the first
+        #result comes back, a window keeps only a few shards per worker in flight
+        with PARSE_POOL_LOCK:
+            #A pool of another size is replaced. It isn't shut down here, a search
+            #still using it keeps it open and it closes once that search lets go of it.
+            if PARSE_POOL is None or PARSE_POOL_SIZE != workers:
+                PARSE_POOL, PARSE_POOL_SIZE = ProcessPoolExecutor(max_workers=workers), workers
+            pool = PARSE_POOL
+        parsed_shards = window_submitter(lambda shard: pool.submit(articles_parser, shard), shards, 2*workers)
+
+    def shard_results():
+        #Each article's counts are taken before shard_merger() adds it in
+        for parsed_articles in parsed_shards:
+            for parsed in parsed_articles:
+                if article_counts is not None:
+                    article_counts.append(article_counter(parsed))
+                yield parsed
+
+    if approximate:
+        counter = Heavy_Hitters(HEAVY_HITTERS, Count_Min_Sketch(SKETCH_EPSILON, SKETCH_DELTA))
+        sentence_count, word_count, counter, tail = shard_merger(shard_results(), counter, Heavy_Hitters.add)
+        word_dict = counter.word_dict()
+    else:
+        sentence_count, word_count, word_dict, tail = shard_merger(shard_results())
     cache[search_keyword] = Topic_Results(search_keyword,sentence_count,word_count,word_dict)
+    cache[search_keyword].tail = tail
+    if approximate:
+        cache[search_keyword].count_bounds = counter.count_bounds()
     return cache[search_keyword]
 
+class Count_Min_Sketch:
+    """
+    Fixed-size table of approximate word counts. A count is never too low, and is too
+    high by more than epsilon times the total of all counts only with probability
+    delta. Memory is depth x width counters, whatever the number of distinct words.
+    """
+    def __init__(self,epsilon=SKETCH_EPSILON,delta=SKETCH_DELTA):
+        import numpy as np
+        self.width = math.ceil(math.e/epsilon)
+        self.depth = math.ceil(math.log(1/delta))
+        self.epsilon = epsilon
+        self.table = np.zeros((self.depth, self.width), dtype=np.int64)
+        self.total = 0
+
+    def columns(self,words):
+        """
+        The column of each word in every row of the table, a depth x len(words) array.
+        Two hashes of the word are combined, a different way for each row.
+        """
+        import numpy as np
+        encoded = [word.encode("utf-8") for word in words]
+        first = np.array([zlib.crc32(word) for word in encoded], dtype=np.int64)
+        second = np.array([zlib.adler32(word) | 1 for word in encoded], dtype=np.int64)
+        rows = np.arange(self.depth, dtype=np.int64)[:,None]
+        return (first[None,:] + rows*second[None,:]) % self.width
+
+    def add(self,counts):
+        """
+        Adds a dict of word -> count to the sketch.
+        """
+        import numpy as np
+        if not counts:
+            return
+        values = np.fromiter(counts.values(), dtype=np.int64, count=len(counts))
+        columns = self.columns(list(counts))
+        for row in range(self.depth):
+            np.add.at(self.table[row], columns[row], values)
+        self.total += int(values.sum())
+
+    def estimates(self,words):
+        """
+        Upper bounds on the counts of a list of words.
+        """
+        import numpy as np
+        columns = self.columns(words)
+        return self.table[np.arange(self.depth)[:,None], columns].min(axis=0).tolist()
+
+    def error_bound(self):
+        """
+        How much too high any estimate can be, except with probability delta.
+        """
+        return math.ceil(self.epsilon*self.total)
+
+class Heavy_Hitters:
+    """
+    Keeps the counts of the most used words in a fixed amount of memory, with the
+    Space-Saving algorithm. Up to capacity words are tracked. When a new word comes
+    in and there is no room, it takes the place of the least used word, and its count
+    starts from that word's count, which is kept as its error. Every word used more
+    than total/capacity times is always tracked.
+
+    Each tracked word keeps its word_dict counts from when it started being tracked,
+    so they never count too many. The sketch, if there is one, sees every word and
+    narrows the upper bound on each count.
+    """
+    def __init__(self,capacity=HEAVY_HITTERS,sketch=None):
+        self.capacity = capacity
+        self.sketch = sketch
+        self.entries = {} #word -> [lowercase, titlecase, other, total uses while tracked, error]
+        self.heap = [] #(count, word), entries whose count has changed since are skipped
+        self.total = 0
+
+    def add(self,word_dict):
+        """
+        Adds a word_dict of counts, see word_counter().
+        """
+        if self.sketch is not None:
+            self.sketch.add({word: counts[3] for word, counts in word_dict.items()})
+        for word, counts in word_dict.items():
+            entry = self.entries.get(word)
+            if entry is None:
+                error = 0
+                if len(self.entries) >= self.capacity:
+                    error, smallest = self.smallest_popper()
+                    del self.entries[smallest]
+                entry = self.entries[word] = [0,0,0,0,error]
+            for i in range(4):
+                entry[i] += counts[i]
+            self.total += counts[3]
+            heapq.heappush(self.heap, (entry[3]+entry[4], word))
+        if len(self.heap) > 4*self.capacity:
+            self.heap = [(entry[3]+entry[4], word) for word, entry in self.entries.items()]
+            heapq.heapify(self.heap)
+
+    def smallest_popper(self):
+        """
+        Takes the least used tracked word off the heap and returns (count, word).
+        """
+        while True:
+            count, word = heapq.heappop(self.heap)
+            entry = self.entries.get(word)
+            if entry is not None and entry[3]+entry[4] == count:
+                return count, word
+
+    def word_dict(self):
+        """
+        The tracked words and the uses seen while they were tracked, as a word_dict.
+        """
+        return {word: entry[:4] for word, entry in self.entries.items()}
+
+    def count_bounds(self):
+        """
+        The lowest and highest each tracked word's real count could be, as a dict of
+        word -> (low, high).
+        """
+        words = list(self.entries)
+        highs = [entry[3]+entry[4] for entry in self.entries.values()]
+        if self.sketch is not None and words:
+            highs = [min(high, estimate) for high, estimate in zip(highs, self.sketch.estimates(words))]
+        return {word: (self.entries[word][3], high) for word, high in zip(words, highs)}
+
+    def error_bound(self):
+        """
+        How much too high any count can be.
+        """
+        bound = self.total//self.capacity
+        if self.sketch is not None:
+            bound = min(bound, self.sketch.error_bound())
+        return bound
+
 def word_classifer(word):
+    """
+    Classifies a single word with word_lookup() and stores the result in the word cache.
+
+    Parameter
+    ---------
+    word (string)
+
+    Return
+    ---------
+    Results (List of attributes)
+    """
+    word_cache[word.lower()] = syllable_filler({word: word_lookup(word)})[word]
+    return word_cache[word.lower()]
+
+def syllable_filler(records):
+    """
+    Fills in the syllables of word_lookup() records that Datamuse didn't know, with
+    one syllable_estimates() call for all of them.
+
+    Parameter
+    ---------
+    records (dict) word -> record, changed in place
+
+    Return
+    ---------
+    records (dict)
+    """
+    unknown = [word for word, record in records.items() if record[1] is None]
+    if unknown:
+        estimates = syllable_estimates(unknown)
+        for word in unknown:
+            records[word][1] = estimates[word]
+    return records
+
+def classify_words(words):
+    """
+    Makes sure every word in a collection is in the word cache. The words that are
+    missing are looked up at the same time on the shared classification pool and
+    the results are written into the cache in batches of CLASSIFY_BATCH_SIZE as
+    they come back.
+
+    If another topic is already looking up one of the words, the running lookup is
+    reused instead of sending a second request for the same word.
+
+    Parameter
+    ---------
+    words (iterable of strings) lowercase words
+
+    Return
+    ---------
+    None
+    """
+    global CLASSIFY_POOL
+    words = list(dict.fromkeys(words))
+    futures = {}
+    owned = [] #Words whose lookups were started by this call
+    derived, deferred = {}, []
+    #The cache read and the in-flight registration happen under one lock, so a word
+    #another call finishes in between is seen either in the cache or in flight
+    with IN_FLIGHT_LOCK:
+        if CLASSIFY_POOL is None:
+            CLASSIFY_POOL = ThreadPoolExecutor(max_workers=CLASSIFY_WORKERS)
+        known = word_cache.get_many(words)
+        missing = [word for word in words if word not in known]
+        if LEMMA_REUSE:
+            derived, deferred = lemma_classifier(missing)
+            word_cache.update(derived)
+            #A lemma another call is looking up is waited for (and written) here too
+            for word in deferred:
+                for lemma, *rule in lemma_candidates(word):
+                    if lemma in IN_FLIGHT_WORDS and lemma not in missing:
+                        futures[lemma] = IN_FLIGHT_WORDS[lemma]
+        skipped = set(derived).union(deferred)
+        for word in missing:
+            if word in skipped:
+                continue
+            try:
+                futures[word] = IN_FLIGHT_WORDS[word]
+            except KeyError:
+                futures[word] = context_submitter(CLASSIFY_POOL, word_lookup, word)
+                IN_FLIGHT_WORDS[word] = futures[word]
+                owned.append(word)
+    cache_counter("word", hits=len(known), misses=len(missing))
+    if LEMMA_REUSE:
+        cache_counter("lemma", hits=len(derived), misses=len(missing)-len(derived))
+
+    word_of = {future: word for word, future in futures.items()}
+    batch = {}
+    try:
+        for future in as_completed(word_of):
+            batch[word_of[future]] = future.result()
+            if len(batch) >= CLASSIFY_BATCH_SIZE:
+                syllable_filler(batch)
+                with IN_FLIGHT_LOCK:
+                    word_cache.update(batch)
+                batch = {}
+        syllable_filler(batch)
+        with IN_FLIGHT_LOCK:
+            word_cache.update(batch)
+    finally:
+        with IN_FLIGHT_LOCK:
+            for word in owned:
+                IN_FLIGHT_WORDS.pop(word, None)
+    if deferred:
+        #Their lemmas are in the cache now, so most of them can be derived
+        classify_words(deferred)
+
+#Suffix rules for lemma_classifier(), tried in order:
+#(suffix, ending of the lemma, lemma part of speech, part of speech of the form, extra syllables)
+#The part of speech of the form is None when it is the same as the lemma's. Extra
+#syllables can also be a function of the lemma, a plural or third person -s adds one
+#after a sibilant and a silent e (prices, changes, cases).
+LEMMA_RULES = (
+    ("ies", "y", ("noun", "verb"), None, 0),
+    ("ied", "y", ("verb",), "verb", 0),
+    ("ily", "y", ("adjective",), "adverb", 1),
+    ("es", "", ("noun", "verb"), None, 1),
+    ("s", "", ("noun", "verb"), None, lambda lemma: 1 if lemma[-1] == "e" and lemma[-2] in "cgsxz" else 0),
+    ("ed", "e", ("verb",), "verb", lambda lemma: 1 if lemma[-2] in "td" else 0),
+    ("ed", "", ("verb",), "verb", lambda lemma: 1 if lemma[-1] in "td" else 0),
+    ("ing", "e", ("verb",), "verb", 1),
+    ("ing", "", ("verb",), "verb", 1),
+    ("ly", "", ("adjective",), "adverb", 1),
+)
+#Common irregular forms: form -> (lemma, syllables of the form)
+IRREGULAR_FORMS = {
+    "ran": ("run", 1), "began": ("begin", 2), "came": ("come", 1), "went": ("go", 1),
+    "gone": ("go", 1), "said": ("say", 1), "made": ("make", 1), "took": ("take", 1),
+    "taken": ("take", 2), "gave": ("give", 1), "given": ("give", 2), "knew": ("know", 1),
+    "known": ("know", 1), "told": ("tell", 1), "thought": ("think", 1), "brought": ("bring", 1),
+    "bought": ("buy", 1), "caught": ("catch", 1), "taught": ("teach", 1), "left": ("leave", 1),
+    "felt": ("feel", 1), "kept": ("keep", 1), "held": ("hold", 1), "paid": ("pay", 1),
+    "sold": ("sell", 1), "spoke": ("speak", 1), "spoken": ("speak", 2), "wrote": ("write", 1),
+    "written": ("write", 2), "saw": ("see", 1), "seen": ("see", 1), "won": ("win", 1),
+    "lost": ("lose", 1), "met": ("meet", 1), "led": ("lead", 1), "chose": ("choose", 1),
+    "children": ("child", 2), "men": ("man", 1), "women": ("woman", 2), "people": ("person", 2),
+    "mice": ("mouse", 1), "feet": ("foot", 1), "teeth": ("tooth", 1),
+}
+
+def lemma_candidates(word):
+    """
+    The possible lemmas of a word under IRREGULAR_FORMS and LEMMA_RULES, most likely first.
+
+    Parameter
+    ---------
+    word (string) lowercase
+
+    Return
+    ---------
+    list of (lemma, lemma part of speech, part of speech of the form, syllables of the
+    form or a function of the lemma's syllables)
+    """
+    if word in IRREGULAR_FORMS:
+        lemma, syllables = IRREGULAR_FORMS[word]
+        return [(lemma, ("noun", "verb"), None, lambda lemma_syllables: syllables)]
+    candidates = []
+    for suffix, ending, lemma_pos, form_pos, extra in LEMMA_RULES:
+        if not word.endswith(suffix):
+            continue
+        stem = word[:-len(suffix)]
+        lemmas = [stem + ending]
+        if not ending and len(stem) > 3 and stem[-1] == stem[-2] and stem[-1] not in "aeiouls":
+            lemmas.insert(0, stem[:-1]) #running -> run, stopped -> stop
+        for lemma in lemmas:
+            if len(lemma) < 3 or lemma.endswith("s") and suffix == "s":
+                continue
+            if suffix == "es" and not lemma.endswith(("s", "x", "z", "ch", "sh")):
+                continue
+            added = extra(lemma) if callable(extra) else extra
+            candidates.append((lemma, lemma_pos, form_pos, lambda lemma_syllables, added=added: lemma_syllables + added))
+    return candidates
+
+def lemma_holder(words):
+    """
+    The words that could be an inflected form of a lemma, but none of whose possible
+    lemmas are in the word cache yet.
+    """
+    candidates = {word: [lemma for lemma, *rule in lemma_candidates(word)] for word in words}
+    known = word_cache.get_many({lemma for lemmas in candidates.values() for lemma in lemmas})
+    return [word for word, lemmas in candidates.items() if lemmas and not any(lemma in known for lemma in lemmas)]
+
+def lemma_classifier(words):
+    """
+    Classifies inflected forms (runs, stopped, cities, happily, ran...) from a lemma
+    that is already in the word cache, without calling the APIs. The origins come from
+    the lemma, the part of speech from the lemma and the rule that matched, and the
+    syllables are the lemma's plus what the suffix adds. A rule only applies if the
+    lemma has the right part of speech, so "news" isn't taken to be a form of "new".
+
+    Words whose lemma isn't in the cache but is one of the other words, or is being
+    looked up by another call (IN_FLIGHT_WORDS), are put off, so the lemma can be
+    looked up first and the form derived from it after.
+
+    Parameter
+    ---------
+    words (list of strings) lowercase words missing from the word cache
+
+    Return
+    ---------
+    derived (dict) word -> record
+    deferred (list) words to try again once the rest are classified
+    """
+    candidates = {word: lemma_candidates(word) for word in words}
+    lemmas = word_cache.get_many({lemma for options in candidates.values() for lemma, *rule in options})
+    pending = set(words)
+    derived, deferred = {}, []
+    for word, options in candidates.items():
+        for lemma, lemma_pos, form_pos, syllables in options:
+            record = lemmas.get(lemma)
+            if record is None or record[1] is None or not any(pos in record[2] for pos in lemma_pos):
+                continue
+            derived[word] = [word, syllables(record[1]), form_pos or record[2], list(record[3]),
+                             word in words_to_ignore]
+            break
+        else:
+            if any(lemma not in lemmas and (lemma in pending or lemma in IN_FLIGHT_WORDS)
+                   for lemma, *rule in options):
+                deferred.append(word)
+    return derived, deferred
+
+def word_lookup(word):
     """
     Given a word, this function first looks at Datamuse. If the word as written doesn't
-    match the first word result, then word is classified as an Other, an estimation
-    of the syllable count is made and the Origins are empty/unknown.
+    match the first word result, then word is classified as an Other, the syllable count
+    is left as None for syllable_filler() to estimate and the Origins are empty/unknown.
     If the word matches the initial results, the number of syllables is collected and the function
     continues to use the M-W Api to collect part of speech and word origin data.
 
@@ -495,6 +2630,7 @@ def word_classifer(word):
     "Greek", "Latin", "French", (old/middle)"English", "German", "Norse"
 
     Finally, the program classifies each words as a common word to ignore or not using an existing list.
+    The result is returned but not stored, callers decide when to write it to the word cache.
 
     Parameter
     ---------
@@ -506,17 +2642,18 @@ def word_classifer(word):
     """
     origins = []
 
-    response = requests.get(f"https://api.datamuse.com/words?sl={word}")
+    response = api_get("datamuse",DATAMUSE_URL,params={'sl': word})
     datamuse_resp = json.loads(response.text)
 
     if datamuse_resp[0]["word"] == word:
         syllables = datamuse_resp[0]["numSyllables"]
 
-        key = secrets.wordkey
+        key = api_key("wordkey")
         params= {
               'key' : key
         }
-        response = requests.get(f"https://www.dictionaryapi.com/api/v3/references/collegiate/json/{word}",params)
+        mw_url = MW_URL + word
+        response = api_get("merriam_webster",mw_url,params=params)
         word_data = json.loads(response.text)
         if isinstance(word_data[0],dict):
             try:
@@ -533,7 +2670,7 @@ def word_classifer(word):
         else:
             part_of_speech = "Other"
     else:
-        syllables = syllable_estimator(word)
+        syllables = None #Estimated for the whole batch by syllable_filler()
         part_of_speech = 'Other'
 
     if word.lower() in words_to_ignore:
@@ -541,18 +2678,12 @@ def word_classifer(word):
     else:
         ignore = False
 
-    word_cache[word.lower()] = [word.lower(),syllables,part_of_speech,origins,ignore]
-
-    return word_cache[word.lower()]
+    return [word.lower(),syllables,part_of_speech,origins,ignore]
 
 def syllable_estimator(word):
     """
     For words that do not appear in the Datamuse database, this function makes an
-    estimated syllable count by looking at vowel clusters.
-
-    The function assumes no silent e's at the end of words. Words that are input into
-    this function are likely to be proper-nouns or non-English words, so that seems
-    like a safe assumption.
+    estimated syllable count by looking at vowel clusters. See syllable_estimates().
 
     Parameter
     ---------
@@ -562,28 +2693,41 @@ def syllable_estimator(word):
     ---------
     syllable_count (int)
     """
-    syllable_count = 0
-    translated_word = ""
-    #For each letter, translate it into a binary V for vowel or C for consonant
-    for x in word.lower():
-        if x in ['a','e','i','o','u']:
-            translated_word += "V"
-        else:
-            translated_word += "C"
+    return syllable_estimates([word])[word]
 
-    #If a word ends in y, assume that it is used as a vowel
-    #Also, because the algorthm compares consecutive words, a conconant is added
-    #to the end of every word.
-    if word[-1] == 'y':
-        translated_word = translated_word[:-1] + "VC"
-    else:
-        translated_word += "C"
+def syllable_estimates(words):
+    """
+    Estimates the syllables of a batch of words by counting their vowel clusters with
+    the compiled VOWEL_CLUSTERS regex. Words seen before, by any topic, come from
+    SYLLABLE_ESTIMATES without being counted again. The memo is emptied when it
+    reaches SYLLABLE_ESTIMATES_LIMIT words, so a long running process doesn't keep
+    every misspelling and name it has ever seen.
+
+    The function assumes no silent e's at the end of words. Words that are input into
+    this function are likely to be proper-nouns or non-English words, so that seems
+    like a safe assumption. If a word ends in y, the y is taken to be a vowel.
+
+    Parameter
+    ---------
+    words (iterable of strings) not empty
 
-    #Counts the number of vowel clusters
-    for i in range(len(translated_word)-1):
-        if translated_word[i] == "V" and translated_word[i] != translated_word[i+1]:
-            syllable_count += 1
-    return syllable_count
+    Return
+    ---------
+    dict of word -> syllable_count (int)
+    """
+    words = list(dict.fromkeys(words))
+    if len(SYLLABLE_ESTIMATES) + len(words) > SYLLABLE_ESTIMATES_LIMIT:
+        SYLLABLE_ESTIMATES.clear()
+    #The results are built here and the memo is only read from and stored into, so
+    #another thread emptying it in the middle doesn't lose any words
+    estimates = {}
+    for word in words:
+        syllables = SYLLABLE_ESTIMATES.get(word)
+        if syllables is None:
+            lowered = word.lower()[:-1] + "a" if word[-1] == "y" else word.lower()
+            syllables = SYLLABLE_ESTIMATES[word] = len(VOWEL_CLUSTERS.findall(lowered))
+        estimates[word] = syllables
+    return estimates
 
 def usage_trend(search_word,year_start=1900):
     '''
@@ -605,26 +2749,68 @@ def usage_trend(search_word,year_start=1900):
     -------
     list [trend, description]
     '''
-    param = {
-        'content': search_word,
-        'year_start': str(year_start),
-        'year_end': "2018",
-        "corpus":"26",
-    }
-    response = requests.get("https://books.google.com/ngrams/json",params=param)
-    useage_data = json.loads(response.text)
-    time_series = useage_data[0]["timeseries"]
-
-    int_start =int(year_start)
-    int_end = 2019
+    return usage_trends([search_word],year_start)[search_word]
 
-    x = np.arange(int_start,int_end)
-    y = np.array(time_series)
-    r = np.corrcoef(x, y)
+def usage_trends(words,year_start=1900,year_end=2018,corpus=26):
+    '''
+    usage_trend() for many words at once. Time series are read from the trend cache,
+    the missing ones are collected from Ngram NGRAM_BATCH_SIZE words per request and
+    stored. The correlation coefficients for all of the words are then calculated
+    together as one matrix product.
 
-    pearson_r = (r[0, 1])
+    Parameters
+    ----------
+    words (list of strings)
+    year_start (String/int) default of 1900
+    year_end (String/int) default of 2018
+    corpus (int) Ngram corpus number, default of 26 (English 2019)
 
-    if pearson_r > 0.8:
+    Returns
+    -------
+    dict of word -> [trend, description]
+    '''
+    import numpy as np
+    words = list(dict.fromkeys(words))
+    if not words:
+        return {}
+    year_start, year_end, corpus = int(year_start), int(year_end), int(corpus)
+    cache = trend_cache_getter()
+    series_dict = cache.get_many(words, corpus, year_start, year_end)
+
+    missing = [word for word in words if word not in series_dict]
+    cache_counter("trend", hits=len(words)-len(missing), misses=len(missing))
+    for i in range(0, len(missing), NGRAM_BATCH_SIZE):
+        batch = missing[i:i+NGRAM_BATCH_SIZE]
+        param = {
+            'content': ",".join(batch),
+            'year_start': str(year_start),
+            'year_end': str(year_end),
+            "corpus": str(corpus),
+        }
+        response = api_get("ngram",NGRAM_URL,params=param)
+        useage_data = json.loads(response.text)
+        returned = {entry["ngram"]: entry["timeseries"] for entry in useage_data}
+        #Words Ngram doesn't know are stored as never used, so they aren't requested again
+        new_series = {word: returned.get(word, [0.0]*(year_end-year_start+1)) for word in batch}
+        cache.update(new_series, corpus, year_start, year_end)
+        series_dict.update(new_series)
+
+    x = np.arange(year_start, year_end+1, dtype=float)
+    y = np.array([series_dict[word] for word in words], dtype=float)
+    x_centered = x - x.mean()
+    y_centered = y - y.mean(axis=1, keepdims=True)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pearson_r = (y_centered @ x_centered) / (np.linalg.norm(y_centered, axis=1)*np.linalg.norm(x_centered))
+    return {word: trend_describer(r) for word, r in zip(words, pearson_r)}
+
+def trend_describer(pearson_r):
+    '''
+    Translates a correlation coefficient into a trend, see usage_trend(). Words with
+    no usage data (no correlation) are 'flat'.
+    '''
+    if math.isnan(pearson_r):
+        return ['flat', 'flat']
+    elif pearson_r > 0.8:
         return ['up', 'trendy']
     elif pearson_r > 0.5:
         return ['inc', 'gaining popularity']
@@ -635,45 +2821,751 @@ def usage_trend(search_word,year_start=1900):
     else:
         return ['down','archaic']
 
-def results_object_generator(urls,search_keyword,search_count):
+def results_object_generator(urls,search_keyword,search_count,output_dir=".",charts=True):
     """
     Given a search word, calls the two functions required combine text and 
     parse text to create a Topic_Results object. Then, calls all
     methods to populate the remaining attributes for a Topic_Results object.
 
+    Each stage is timed into the running search_metrics() record, or into a new one
+    if the caller didn't start one. The record is kept as results_object.metrics.
+
     Parameters
     ----------
+    urls (list of strings)
     search_keyword (string)
     search_count (int) indexes search counts
+    output_dir (string) folder the charts are written to
+    charts (bool) False leaves the charts to report_renderer()
 
     Returns
     ----------
     Topic_Results (object)
     """
-    text = search_word_grouper(urls)
-    results_object = text_parser(text,search_keyword)
-
-    results_object.word_list_builder()
-    results_object.syllable_counter()
-    results_object.Flesch_reading_ease()
-    results_object.popular_words()
-    results_object.origin_agreggator()
+    metrics = ACTIVE_METRICS.get()
+    if metrics is None:
+        with search_metrics(search_keyword):
+            return results_object_generator(urls,search_keyword,search_count,output_dir,charts)
+
+    if STREAMING_PIPELINE and PARSE_WORKERS <= 1 and not APPROXIMATE_COUNTS:
+        with stage_timer("pipeline"):
+            results_object = streaming_results_builder(urls,search_keyword)
+        results_object.metrics = metrics
+        print(f'Processed {len(results_object.word_table)} unique words.')
+    else:
+        results_object, article_counts = staged_results_builder(urls,search_keyword)
+        results_object.metrics = metrics
+        with stage_timer("aggregation"):
+            results_object.article_stats_adder(article_counts)
+            results_object.syllable_counter()
+            results_object.Flesch_reading_ease()
+            results_object.popular_words()
+            results_object.origin_agreggator()
+            results_object.pos_agreggator()
     results_object.search_number = search_count
-    results_object.origins_bar_graph_maker()
-    results_object.pos_pie_graph_maker()
+    results_object.output_dir = output_dir
+    if charts:
+        with stage_timer("charts"):
+            results_object.origins_bar_graph_maker()
+            results_object.pos_pie_graph_maker()
+    return results_object
+
+def staged_results_builder(urls,search_keyword):
+    """
+    Collects, parses and classifies a topic one stage after another, each stage
+    waiting for the one before it to finish. Leaves the aggregation to the caller.
+
+    Parameters
+    ----------
+    urls (list of strings)
+    search_keyword (string)
+
+    When the text is parsed in shards, the shards are made from the articles as they
+    are downloaded, so the topic's text is never all in memory at once and the
+    downloads and parsing overlap (timed together as "pipeline").
+
+    Returns
+    ----------
+    Topic_Results (object) with its word table filled
+    article_counts (list) article_counter() of each article, in article_urls order
+    """
+    if PARSE_WORKERS > 1 or APPROXIMATE_COUNTS:
+        article_counts = []
+        with stage_timer("pipeline"):
+            results_object = sharded_text_parser(article_text_streamer(urls),search_keyword,
+                                                 approximate=APPROXIMATE_COUNTS,article_counts=article_counts)
+            results_object.article_urls = list(dict.fromkeys(urls))
+    else:
+        with stage_timer("text_collection"):
+            texts = article_texts_collector(urls)
+        with stage_timer("parsing"):
+            results_object = CACHE_DICT[search_keyword] = Topic_Results(search_keyword,0,0,{})
+            delta, article_counts = results_object.text_folder(urls, texts)
+    with stage_timer("classification"):
+        results_object.word_list_builder()
+    return results_object, article_counts
+
+def streaming_results_builder(urls,search_keyword,cache=CACHE_DICT):
+    """
+    Collects, parses, classifies and aggregates a topic all at the same time. The
+    articles are downloaded in the background and each one is parsed as soon as it and
+    the ones before it have arrived. The words it uses for the first time are sent to
+    be classified straight away, and its counts are folded into the totals (see
+    Topic_Results.text_folder() and delta_folder()) as soon as all of its words are
+    classified, whichever lookups finish first. The word table and the popular words
+    are built once at the end from the word_dict, so the results are the same as the
+    staged way.
+
+    With LEMMA_REUSE, words that look like inflected forms of a lemma that isn't in the
+    word cache (see lemma_holder()) are held back and classified together once every
+    article is parsed, so a lemma used in a later article can still save their lookups.
+    Their counts are kept apart and folded on their own, so they don't hold up the
+    articles they are in.
+
+    The stages overlap, so each one's time is recorded as an overlapped stage (see
+    Search_Metrics). Downloads and classification are added up over their threads.
+
+    Parameters
+    ----------
+    urls (list of strings)
+    search_keyword (string)
+
+    Returns
+    ----------
+    Topic_Results (object) with its word table filled and its totals worked out
+    """
+    results_object = cache[search_keyword] = Topic_Results(search_keyword,0,0,{})
+    collect = stage_timer("text_collection", overlapped=True)(article_text_collector)
+    classify = stage_timer("classification", overlapped=True)(classify_words)
+    classified_by = {} #word -> the classification its lookup is part of, None if held
+    pending = [] #(delta, classifications it needs), folded when they are all done
+    held, held_delta = [], {}
+    article_counts = []
+
+    def ready_folder():
+        #Folds every delta whose words are all classified, and returns the
+        #classifications the rest are still waiting for
+        waiting = set()
+        for entry in list(pending):
+            delta, classifications = entry
+            unfinished = {classified for classified in classifications if not classified.done()}
+            if unfinished:
+                waiting |= unfinished
+                continue
+            for classified in classifications:
+                classified.result()
+            with stage_timer("aggregation", overlapped=True):
+                results_object.delta_folder(delta, table=False)
+            pending.remove(entry)
+        return waiting
+
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as fetcher, \
+         ThreadPoolExecutor(max_workers=FETCH_WORKERS) as classifier:
+        futures = {}
+        for url in urls:
+            if url not in futures:
+                futures[url] = context_submitter(fetcher, collect, url)
+        for url, future in futures.items():
+            while not future.done():
+                wait(ready_folder() | {future}, return_when=FIRST_COMPLETED)
+            text = future.result()
+            with stage_timer("parsing", overlapped=True):
+                delta, added_counts = results_object.text_folder([url], {url: text})
+                article_counts.extend(added_counts)
+                new_words = [word for word in delta if word not in classified_by]
+                held_words = set(lemma_holder(new_words)) if LEMMA_REUSE else set()
+            classified = context_submitter(classifier, classify,
+                                           [word for word in new_words if word not in held_words])
+            for word in new_words:
+                classified_by[word] = None if word in held_words else classified
+            held.extend(held_words)
+            for word in [word for word in delta if classified_by[word] is None]:
+                counts = held_delta.setdefault(word, [0,0,0,0])
+                for i, change in enumerate(delta.pop(word)):
+                    counts[i] += change
+            pending.append((delta, {classified_by[word] for word in delta}))
+            ready_folder()
+        if held:
+            pending.append((held_delta, {context_submitter(classifier, classify, held)}))
+        waiting = ready_folder()
+        while waiting:
+            wait(waiting, return_when=FIRST_COMPLETED)
+            waiting = ready_folder()
+        with stage_timer("aggregation", overlapped=True):
+            results_object.word_table = Word_Table()
+            results_object.word_table.rows_adder(results_object.word_dict,
+                                                 word_cache.get_many(results_object.word_dict.keys()))
+            results_object.popular_words()
+            results_object.article_stats_adder(article_counts)
+    return results_object
+
+def topic_refresher(search_keyword,search_count=1,output_dir=".",urls=None,charts=True):
+    """
+    Brings a tracked topic up to date. The first time, the topic is built in full.
+    After that, only the articles that weren't counted before are collected, parsed
+    and classified, and the topic's totals are updated with them. The state of the
+    topic is saved after each refresh, and the charts are redrawn.
+
+    Parameters
+    ----------
+    search_keyword (string)
+    search_count (int) indexes search counts
+    output_dir (string) folder the charts are written to
+    urls (list of strings) optional, defaults to searching for search_keyword. When the
+        topic is already stored, every article from the day of the last refresh on is
+        searched for, newest first, up to the first one that was already counted
+    charts (bool) False leaves the charts to report_renderer()
+
+    Returns
+    ----------
+    Topic_Results (object)
+    """
+    store = Topic_Store(TOPIC_STORE_PATH)
+    with search_metrics(search_keyword):
+        try:
+            results_object = CACHE_DICT[search_keyword]
+        except KeyError:
+            state = store.get(search_keyword)
+            results_object = None if state is None else Topic_Results.state_loader(search_keyword, state)
+        if urls is None:
+            with stage_timer("url_fetch"):
+                if results_object is None:
+                    urls = article_url_fetcher(search_keyword)
+                else:
+                    #Only articles since the last refresh can be new. They come newest
+                    #first, so paging goes on until an article that was already counted
+                    #turns up (or the results run out), however many there are.
+                    begin_date = max(filter(None, (SEARCH_BEGIN_DATE, results_object.last_refreshed)), default=None)
+                    seen = set(results_object.article_urls)
+                    urls = []
+                    for url in article_url_pager(search_keyword,NYT_MAX_PAGES*NYT_PAGE_SIZE,begin_date,sort="newest"):
+                        if url in seen:
+                            break
+                        urls.append(url)
+
+        if results_object is None:
+            results_object = results_object_generator(urls,search_keyword,search_count,output_dir,charts)
+        else:
+            seen = set(results_object.article_urls)
+            new_urls = [url for url in urls if url not in seen]
+            with stage_timer("text_collection"):
+                texts = article_texts_collector(new_urls)
+            with stage_timer("classification"):
+                added = results_object.articles_folder(new_urls, texts)
+            print(f"Added {added} new articles to {search_keyword}.")
+            results_object.search_number = search_count
+            results_object.output_dir = output_dir
+            if charts:
+                with stage_timer("charts"):
+                    results_object.origins_bar_graph_maker()
+                    results_object.pos_pie_graph_maker()
+        results_object.last_refreshed = time.strftime("%Y%m%d")
+        CACHE_DICT[search_keyword] = results_object
+        store[search_keyword] = results_object.state_maker()
+    store.close()
     return results_object
 
-def output_maker(results01,results02):
+def output_maker(results_objects,output_dir=".",file_name="comparison.html"):
+    """
+    Puts the html_report() cells of several topics side by side on one page.
+
+    Parameters
+    ----------
+    results_objects (list of Topic_Results)
+    output_dir (string) folder the page is written to, the topics' charts should be there too
+    file_name (string)
+
+    Returns
+    ----------
+    path of the page (string)
+    """
+    topics = ", ".join(results_object.topic for results_object in results_objects)
+    return report_renderer(results_objects, output_dir, file_name, f"Comparing {topics}")
+
+def report_renderer(results_objects,output_dir,file_name,title):
+    """
+    Writes a report page for one or more topics with all of their charts built in one
+    pass and put straight into the page. The page loads the single copy of plotly.js
+    in output_dir instead of every chart carrying its own.
+
+    Parameters
+    ----------
+    results_objects (list of Topic_Results)
+    output_dir (string)
+    file_name (string)
+    title (string)
+
+    Returns
+    ----------
+    path of the page (string)
+    """
+    report_assets_copier(output_dir)
+    with stage_timer("charts"):
+        plotly_bundle_writer(output_dir)
+        fragments = [results_object.chart_fragments() for results_object in results_objects]
+    cells = [results_object.html_report(chart_html)
+             for results_object, chart_html in zip(results_objects, fragments)]
+    page = report_page_maker(cells, title, [PLOTLY_BUNDLE])
+    page_path = os.path.join(output_dir, file_name)
+    with open(page_path, "w") as report:
+        report.write(page)
+    return page_path
+
+def plotly_bundle_writer(output_dir):
+    """
+    Writes plotly.js to output_dir, unless it is already there. The file is written
+    under a temporary name and then renamed, so a page never sees half of it.
+    """
+    bundle_path = os.path.join(output_dir, PLOTLY_BUNDLE)
+    if os.path.exists(bundle_path):
+        return
+    from plotly.offline import get_plotlyjs
+    os.makedirs(output_dir, exist_ok=True)
+    temp_path = f"{bundle_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as bundle:
+        bundle.write(get_plotlyjs())
+    os.replace(temp_path, bundle_path)
+
+def chart_file_writer(fig,output_dir,file_name):
+    """
+    Writes a chart to its own small HTML file that loads the shared plotly.js from
+    the same folder.
+    """
+    plotly_bundle_writer(output_dir)
+    fig.write_html(os.path.join(output_dir, file_name), include_plotlyjs="directory", auto_open=False)
+
+def comparison_report(topics,output_dir=".",first_search_number=1):
+    """
+    Builds one side by side report for several topics. The work the topics have in
+    common is only done once: articles found under more than one topic are downloaded
+    once, every unique word across all of the topics is classified in one batch, and
+    the usage trends of all of the topics' popular words are fetched together.
+
+    Parameters
+    ----------
+    topics (list of strings)
+    output_dir (string)
+    first_search_number (int) search number of the first topic, the rest follow it
+
+    Returns
+    ----------
+    (list of Topic_Results, path of the report page)
+    """
+    topics = list(dict.fromkeys(topics))
+    os.makedirs(output_dir, exist_ok=True)
+    with search_metrics(" vs ".join(topics)):
+        with stage_timer("url_fetch"):
+            topic_urls = {topic: article_url_fetcher(topic) for topic in topics}
+        with stage_timer("text_collection"):
+            texts = article_texts_collector([url for urls in topic_urls.values() for url in urls])
+        with stage_timer("parsing"):
+            results_objects, article_counts = [], []
+            for topic in topics:
+                results_object = CACHE_DICT[topic] = Topic_Results(topic,0,0,{})
+                delta, added_counts = results_object.text_folder(topic_urls[topic], texts)
+                results_objects.append(results_object)
+                article_counts.append(added_counts)
+        with stage_timer("classification"):
+            classify_words(word for results_object in results_objects for word in results_object.word_dict)
+            for results_object in results_objects:
+                results_object.word_list_builder()
+        with stage_timer("aggregation"):
+            for results_object, added_counts in zip(results_objects, article_counts):
+                results_object.article_stats_adder(added_counts)
+                results_object.syllable_counter()
+                results_object.Flesch_reading_ease()
+                results_object.popular_words()
+                results_object.origin_agreggator()
+        for search_number, results_object in enumerate(results_objects, start=first_search_number):
+            results_object.search_number = search_number
+            results_object.output_dir = output_dir
+        #Warms the trend cache so each topic's html_report() doesn't need the network
+        usage_trends(word for results_object in results_objects for word in results_object.most_popular_words)
+        page_path = output_maker(results_objects, output_dir) #Builds the charts too
+    return results_objects, page_path
+
+def report_page_maker(html_cells,title="New Word search",scripts=()):
+    """
+    Wraps html_report() cells into a complete page, one column per topic.
+
+    Parameters
+    ----------
+    html_cells (list of strings)
+    title (string)
+    scripts (list of strings) script files the page loads in its head
+
+    Returns
+    ----------
+    page (string)
+    """
+    cells = "".join(html_cells)
+    script_tags = "".join(f'<script src="{script}"></script>' for script in scripts)
+    return f"""<HTML>
+    <HEAD><TITLE>{escape(title)}</TITLE>{script_tags}</HEAD>
+    <BODY>
+    <TABLE><TR VALIGN='top'>{cells}</TR></TABLE>
+    </BODY>
+    </HTML>
+    """
+
+def report_assets_copier(output_dir):
+    """
+    Creates output_dir if needed and copies the trend pictures used by html_report() into it.
     """
+    os.makedirs(output_dir, exist_ok=True)
+    source_dir = os.path.dirname(os.path.abspath(__file__))
+    for trend in ("up", "inc", "flat", "dec", "down"):
+        source = os.path.join(source_dir, f"z_{trend}.png")
+        target = os.path.join(output_dir, f"z_{trend}.png")
+        if os.path.abspath(source) != os.path.abspath(target) and not os.path.exists(target):
+            shutil.copyfile(source, target)
+
+#Settings the command line (or a caller) can change, passed on to batch workers.
+#Workers started with spawn or forkserver import the module again and would
+#otherwise only see the defaults.
+WORKER_SETTINGS = ("SEARCH_ARTICLE_COUNT", "SEARCH_BEGIN_DATE", "SEARCH_END_DATE", "PARSE_WORKERS",
+                   "APPROXIMATE_COUNTS", "STREAMING_PIPELINE", "LEMMA_REUSE",
+                   "WORD_CACHE_PATH", "ARTICLE_CACHE_PATH", "TREND_CACHE_PATH", "METRICS_LOG_PATH")
+
+def worker_settings():
     """
-    pass
+    The current values of WORKER_SETTINGS, to hand to worker_initializer().
+    """
+    return {name: globals()[name] for name in WORKER_SETTINGS}
+
+def worker_initializer(workers=1,settings=None):
+    """
+    Runs at the start of each batch worker process. The parent's settings are applied
+    first. Connections, sessions and thread pools copied from the parent process can't
+    be reused, so they are all opened again by the worker, and the worker gets its own
+    connection to the shared word cache. The article search rate limit is split evenly
+    between the workers.
+
+    Parameters
+    ----------
+    workers (int) number of worker processes
+    settings (dict) optional, worker_settings() of the parent process
+    """
+    global word_cache, ARTICLE_CACHE, TREND_CACHE, CLASSIFY_POOL, HTTP_SESSIONS, NYT_RATE_LIMITER
+    global HTTP_SESSIONS_LOCK, IN_FLIGHT_LOCK, ARTICLE_CACHE_LOCK, TREND_CACHE_LOCK, IN_FLIGHT_WORDS, PARSE_POOL
+    global PARSE_POOL_LOCK, PARSE_POOL_SIZE
+    if settings:
+        globals().update(settings)
+    HTTP_SESSIONS, IN_FLIGHT_WORDS, PARSE_POOL, PARSE_POOL_SIZE = {}, {}, None, 0
+    HTTP_SESSIONS_LOCK, IN_FLIGHT_LOCK, PARSE_POOL_LOCK = threading.Lock(), threading.Lock(), threading.Lock()
+    ARTICLE_CACHE_LOCK, TREND_CACHE_LOCK = threading.Lock(), threading.Lock()
+    ARTICLE_CACHE, TREND_CACHE, CLASSIFY_POOL = None, None, None
+    NYT_RATE_LIMITER = Token_Bucket(NYT_REQUESTS_PER_MINUTE/60/workers, 1)
+    word_cache = word_cache_loader()
+
+def batch_topic_worker(topic,search_count,output_dir):
+    """
+    Runs one topic of a batch in a worker process: searches for articles, builds the
+    results and charts and writes the topic's report page.
+
+    Parameters
+    ----------
+    topic (string)
+    search_count (int) numbers the topic's files
+    output_dir (string)
+
+    Returns
+    ----------
+    (summary, report file name), or (message, None) if no articles were found
+    """
+    with search_metrics(topic):
+        with stage_timer("url_fetch"):
+            urls = article_search_collector(topic)
+        if len(urls) < 1:
+            return (f"No results were returned for {topic}.", None)
+        results_object = results_object_generator(urls,topic,search_count,output_dir,charts=False)
+        report_file = f"report{search_count}.html"
+        report_renderer([results_object], output_dir, report_file, topic)
+    return (str(results_object), report_file)
+
+def batch_runner(topics,output_dir,workers=BATCH_WORKERS):
+    """
+    Analyzes many topics without any prompts. Topics are spread over a pool of worker
+    processes that share the word cache database. Each topic's charts and report are
+    written to output_dir along with an index.html linking to them. A topic that fails
+    (a network error, a bad response) is reported and listed in the index, and the
+    rest of the batch carries on.
+
+    Parameters
+    ----------
+    topics (list of strings)
+    output_dir (string)
+    workers (int) number of worker processes
+
+    Returns
+    ----------
+    dict of topic -> report file name (None if no articles were found or the topic failed)
+    """
+    report_assets_copier(output_dir)
+    topics = list(dict.fromkeys(topics))
+    reports, errors = {}, {}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=worker_initializer,
+                             initargs=(workers, worker_settings())) as pool:
+        futures = {pool.submit(batch_topic_worker, topic, count, output_dir): topic
+                   for count, topic in enumerate(topics, start=1)}
+        for future in as_completed(futures):
+            topic = futures[future]
+            try:
+                summary, report_file = future.result()
+            except Exception as error:
+                summary, report_file = f"Could not analyze {topic}: {error!r}", None
+                errors[topic] = repr(error)
+            reports[topic] = report_file
+            print(summary)
+    minutes = (time.perf_counter() - start)/60
+    print(f"Analyzed {len(topics)} topics in {minutes*60:.1f} seconds ({len(topics)/minutes:.1f} topics per minute).")
+
+    links = "".join(f"<LI><A HREF='{escape(reports[topic])}'>{escape(topic)}</A></LI>" if reports[topic]
+                    else f"<LI>{escape(topic)} (failed: {escape(errors[topic])})</LI>" if topic in errors
+                    else f"<LI>{escape(topic)} (no articles)</LI>"
+                    for topic in topics)
+    with open(os.path.join(output_dir, "index.html"), "w") as index:
+        index.write(f"<HTML><HEAD><TITLE>New Word search</TITLE></HEAD><BODY><UL>{links}</UL></BODY></HTML>")
+    return reports
+
+class Report_Server:
+    """
+    A long-running HTTP service for topic reports. The word, article and trend caches
+    and the finished topics in CACHE_DICT stay open and in memory between requests.
+
+        GET /                   the topics analyzed so far and a search box
+        GET /analyze?topic=...  analyzes the topic, then redirects to its report
+        GET /<file>             a report page, chart or plotly.min.js from output_dir
+
+    A topic that is already being analyzed isn't started again, every request for it
+    waits for the same analysis. New topics wait in a queue of queue_size for one of
+    the workers, and once the queue is full the server answers 503 until there is room,
+    which keeps the upstream APIs from being asked for more than they can take.
+    """
+    CONTENT_TYPES = {".html": "text/html; charset=utf-8", ".js": "application/javascript",
+                     ".png": "image/png", ".json": "application/json"}
+
+    def __init__(self,output_dir,workers=SERVER_WORKERS,queue_size=SERVER_QUEUE_SIZE):
+        self.output_dir = output_dir
+        self.workers = workers
+        self.queue_size = queue_size
+        self.queue = None #asyncio.Queue of topics, made once the event loop is running
+        self.jobs = {} #topic -> future of its analysis, for topics queued or running
+        self.reports = {} #topic -> report file name, None if no articles were found
+        self.search_count = 0
+
+    async def serve(self,host="127.0.0.1",port=SERVER_PORT):
+        """
+        Starts the workers and answers requests until the task is cancelled.
+        """
+        import asyncio
+        report_assets_copier(self.output_dir)
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        workers = [asyncio.create_task(self.analysis_worker()) for _ in range(self.workers)]
+        server = await asyncio.start_server(self.request_handler, host, port)
+        print(f"Serving reports on http://{host}:{port}/")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for worker in workers:
+                worker.cancel()
+
+    async def analysis_worker(self):
+        """
+        Takes topics off the queue and analyzes them one at a time on a thread, so the
+        event loop keeps answering requests in the meantime.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        while True:
+            topic, search_count = await self.queue.get()
+            future = self.jobs[topic]
+            try:
+                summary, report_file = await loop.run_in_executor(
+                    None, batch_topic_worker, topic, search_count, self.output_dir)
+                self.reports[topic] = report_file
+                print(summary)
+                future.set_result(report_file)
+            except Exception as error:
+                future.set_exception(error)
+            finally:
+                del self.jobs[topic]
+                self.queue.task_done()
+
+    def topic_requester(self,topic):
+        """
+        The future of a topic's analysis, queuing the topic if it isn't already
+        queued or running.
+
+        Returns
+        -------
+        asyncio.Future of the report file name, or None if the queue is full
+        """
+        import asyncio
+        try:
+            return self.jobs[topic]
+        except KeyError:
+            pass
+        if self.queue.full():
+            return None
+        self.search_count += 1
+        future = self.jobs[topic] = asyncio.get_running_loop().create_future()
+        self.queue.put_nowait((topic, self.search_count))
+        return future
+
+    async def request_handler(self,reader,writer):
+        """
+        Reads one GET request and writes the response.
+        """
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()).strip(): #Headers aren't needed
+                pass
+            method, target = request_line.decode("latin-1").split()[:2]
+        except (ValueError, ConnectionError):
+            writer.close()
+            return
+        if method != "GET":
+            status, headers, body = 405, {}, b"Only GET is supported"
+        else:
+            status, headers, body = await self.response_maker(target)
+        reason = {200: "OK", 303: "See Other", 404: "Not Found", 405: "Method Not Allowed",
+                  502: "Bad Gateway", 503: "Service Unavailable"}[status]
+        headers.setdefault("Content-Type", "text/plain; charset=utf-8")
+        head = f"HTTP/1.1 {status} {reason}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
+
+    async def response_maker(self,target):
+        """
+        Works out the response for a request path.
+
+        Returns
+        -------
+        (status, headers, body)
+        """
+        url = urlparse(target)
+        if url.path == "/":
+            return 200, {"Content-Type": self.CONTENT_TYPES[".html"]}, self.index_maker().encode("utf-8")
+        if url.path == "/analyze":
+            topic = " ".join(parse_qs(url.query).get("topic", [""])[0].split())
+            if not topic:
+                return 303, {"Location": "/"}, b""
+            if topic not in self.reports:
+                future = self.topic_requester(topic)
+                if future is None:
+                    return 503, {"Retry-After": "30"}, b"Too many topics are waiting, try again soon"
+                try:
+                    await future
+                except Exception as error:
+                    return 502, {}, f"The analysis of {topic} failed: {error}".encode("utf-8")
+            if self.reports[topic] is None:
+                return 404, {}, f"No articles were found for {topic}".encode("utf-8")
+            return 303, {"Location": "/" + self.reports[topic]}, b""
+        file_name = os.path.basename(url.path)
+        path = os.path.join(self.output_dir, file_name)
+        if not os.path.isfile(path):
+            return 404, {}, b"Not found"
+        with open(path, "rb") as served_file:
+            body = served_file.read()
+        content_type = self.CONTENT_TYPES.get(os.path.splitext(file_name)[1], "application/octet-stream")
+        return 200, {"Content-Type": content_type}, body
+
+    def index_maker(self):
+        """
+        The front page: a search box and the topics analyzed or in progress.
+        """
+        links = "".join(f"<LI><A HREF='{escape(report_file)}'>{escape(topic)}</A></LI>" if report_file
+                        else f"<LI>{escape(topic)} (no articles)</LI>" for topic, report_file in self.reports.items())
+        links += "".join(f"<LI>{escape(topic)} (in progress)</LI>" for topic in self.jobs)
+        return f"""<HTML><HEAD><TITLE>New Word search</TITLE></HEAD><BODY>
+        <FORM action="/analyze"><INPUT name="topic"> <INPUT type="submit" value="Analyze"></FORM>
+        <UL>{links}</UL></BODY></HTML>"""
+
+def report_server(output_dir,port=SERVER_PORT,workers=SERVER_WORKERS):
+    """
+    Runs a Report_Server until it is interrupted.
+    """
+    import asyncio
+    try:
+        asyncio.run(Report_Server(output_dir, workers).serve(port=port))
+    except KeyboardInterrupt:
+        pass
+
+def topics_reader(topics_file):
+    """
+    Reads one topic per line from a file, skipping blank lines and lines starting with #.
+    """
+    with open(topics_file) as topics:
+        return [line.strip() for line in topics if line.strip() and not line.startswith("#")]
+
+def argument_parser():
+    parser = argparse.ArgumentParser(description="Explore the word usage in news articles about different topics.")
+    parser.add_argument("--topics", nargs="+", default=[], help="topics to analyze without prompting")
+    parser.add_argument("--topics-file", help="file with one topic per line to analyze without prompting")
+    parser.add_argument("--refresh", nargs="+", default=[], help="tracked topics to update with their new articles")
+    parser.add_argument("--compare", nargs="+", default=[], help="topics to put side by side in one report")
+    parser.add_argument("--articles", type=int, default=SEARCH_ARTICLE_COUNT, help="articles to collect per topic")
+    parser.add_argument("--begin-date", help="only articles from this date on (YYYYMMDD)")
+    parser.add_argument("--end-date", help="only articles up to this date (YYYYMMDD)")
+    parser.add_argument("--output-dir", default="reports", help="folder for batch charts and reports")
+    parser.add_argument("--workers", type=int, help=f"number of batch worker processes (default {BATCH_WORKERS}), "
+                                                    f"or topics --serve analyzes at once (default {SERVER_WORKERS})")
+    parser.add_argument("--parse-workers", type=int, default=PARSE_WORKERS, help="processes each topic's text is parsed on")
+    parser.add_argument("--approximate", action="store_true", help="count words in fixed memory, keeping only the most used")
+    parser.add_argument("--metrics-log", help="JSON lines file each search's timings and cache counts are added to")
+    parser.add_argument("--serve", action="store_true", help="run a report server that keeps the caches warm")
+    parser.add_argument("--port", type=int, default=SERVER_PORT, help="port for --serve")
+    parser.add_argument("--build-lexicon", action="store_true", help="compile the word cache into a snapshot for fast lookups")
+    return parser
 
 
 if __name__ == "__main__":
+    args = argument_parser().parse_args()
+    SEARCH_ARTICLE_COUNT = args.articles
+    SEARCH_BEGIN_DATE, SEARCH_END_DATE = args.begin_date, args.end_date
+    PARSE_WORKERS = args.parse_workers
+    APPROXIMATE_COUNTS = args.approximate
+    METRICS_LOG_PATH = args.metrics_log
     word_cache = word_cache_loader()
 
+    if args.build_lexicon:
+        word_count = lexicon_snapshot_builder(word_cache)
+        print(f"Saved {word_count} words to {LEXICON_SNAPSHOT_PATH}")
+        word_cache_saver(word_cache)
+        sys.exit()
+    if args.serve:
+        report_server(args.output_dir, args.port, args.workers or SERVER_WORKERS)
+        word_cache_saver(word_cache)
+        sys.exit()
+    if args.topics or args.topics_file:
+        topics = args.topics + (topics_reader(args.topics_file) if args.topics_file else [])
+        batch_runner(topics, args.output_dir, args.workers or BATCH_WORKERS)
+        word_cache_saver(word_cache)
+        sys.exit()
+    if args.refresh:
+        report_assets_copier(args.output_dir)
+        for search_count, topic in enumerate(args.refresh, start=1):
+            results_object = topic_refresher(topic, search_count, args.output_dir, charts=False)
+            report_renderer([results_object], args.output_dir, f"report{search_count}.html", topic)
+            print(results_object)
+        word_cache_saver(word_cache)
+        sys.exit()
+    if args.compare:
+        results_objects, page_path = comparison_report(args.compare, args.output_dir)
+        print(f"Comparison report saved to {page_path}")
+        word_cache_saver(word_cache)
+        sys.exit()
 
     search_reports= {}
+    search_results = {}
     search_count = 0
     print("Welcome to the New Word search. The purpose of the app is to allow you explore the different ways language is used.")
     print("At any point, type 'exit!' to quit the program.")
@@ -696,21 +3588,25 @@ if __name__ == "__main__":
         elif search_term.lower() == 'help':
             pass #do help stuff
         else:
-            urls = article_url_fetcher("medicine")
-            if len(urls) < 1:
-                print("No results were returned, please try again.")
-                continue
-            else:
-                search_count += 1
-                results_object = results_object_generator(urls,search_term,search_count)
-                print(results_object)
-                search_reports[search_term] = results_object.html_report()
+            with search_metrics(search_term):
+                with stage_timer("url_fetch"):
+                    urls = article_search_collector(search_term)
+                if len(urls) < 1:
+                    print("No results were returned, please try again.")
+                    continue
+                else:
+                    search_count += 1
+                    results_object = results_object_generator(urls,search_term,search_count)
+                    print(results_object)
+                    search_reports[search_term] = results_object.html_report()
+                    search_results[search_term] = results_object
         if search_count >= 2:
             report_mode = input('Would you like to print a report? Type "yes" or "no": ')
             if report_mode.lower() == "exit!":
                 break
             elif report_mode.lower() in ['yes','ye','y']:
-                pass
+                page_path = output_maker(list(search_results.values()))
+                webbrowser.open("file://" + os.path.abspath(page_path))
             else:
                 print("I'll take that as a 'no'.")
 